@@ -1,8 +1,23 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import mysql.connector
+from mysql.connector import errorcode
+from mysql.connector.constants import ClientFlag
+from doctores import Doctor
+from persistencia import permisos_para
 import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 
 # ========== CONFIGURATION LOADER ============
 def cargar_configuracion():
@@ -13,12 +28,20 @@ def cargar_configuracion():
             parametros[clave] = valor
     return parametros
 
-# ========== ENTITY ===========================
-class Doctor:
-    def __init__(self, nombre, especialidad, cedula):
-        self.nombre = nombre
-        self.especialidad = especialidad
-        self.cedula = cedula
+def dividir_en_lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+# ========== DOMAIN ERRORS ===================
+class CedulaDuplicada(ValueError):
+    pass
+
+class DoctorNoEncontrado(ValueError):
+    pass
 
 # ========== REPOSITORY INTERFACE ============
 class RepositorioDoctores(ABC):
@@ -37,65 +60,1127 @@ class RepositorioDoctores(ABC):
     @abstractmethod
     def existe_cedula(self, cedula): pass
 
+    # Implementaciones genéricas; los repositorios con soporte nativo las reemplazan
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for doctor in doctores:
+            self.agregar(doctor)
+            total += 1
+        return total
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for doctor in doctores:
+            try:
+                self.agregar(doctor)
+            except CedulaDuplicada:
+                self.actualizar(doctor.cedula, doctor)
+            total += 1
+        return total
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for doctor in doctores:
+            try:
+                self.actualizar(doctor.cedula, doctor)
+                total += 1
+            except DoctorNoEncontrado:
+                pass
+        return total
+
+    # Paginación por clave (keyset): el cursor es la última cédula entregada
+    def obtener_pagina(self, despues_de=None, limite=100):
+        ordenados = sorted(self.obtener_todos(), key=lambda d: d.cedula)
+        if despues_de is not None:
+            ordenados = [d for d in ordenados if d.cedula > despues_de]
+        pagina = ordenados[:limite]
+        siguiente = pagina[-1].cedula if len(pagina) == limite else None
+        return pagina, siguiente
+
+    def contar(self):
+        return len(self.obtener_todos())
+
+    def iterar_todos(self, tamano_lote=500):
+        cursor = None
+        while True:
+            pagina, cursor = self.obtener_pagina(cursor, tamano_lote)
+            yield from pagina
+            if cursor is None:
+                return
+
+    def buscar(self, termino, limite=200):
+        termino = termino.lower()
+        if not termino:
+            return self.obtener_pagina(None, limite)[0]
+        encontrados = []
+        for d in self.iterar_todos():
+            if termino in d.nombre.lower() or termino in d.especialidad.lower() or termino in d.cedula.lower():
+                encontrados.append(d)
+                if len(encontrados) == limite:
+                    break
+        return encontrados
+
+# ========== CONNECTION POOL =================
+ERRORES_CONEXION = (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError)
+
+class PoolConexiones:
+    def __init__(self, config, tamano=5, espera_maxima=10.0):
+        self.config = config
+        self.tamano = tamano
+        self.espera_maxima = espera_maxima
+        self._libres = []
+        self._creadas = 0
+        self._condicion = threading.Condition()
+        self._prestamos = 0
+        self._esperas = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._reconexiones = 0
+        self._descartadas = 0
+
+    def _conectar(self):
+        return mysql.connector.connect(
+            host=self.config["host"],
+            user=self.config["user"],
+            password=self.config["password"],
+            database=self.config["database"],
+            # rowcount cuenta filas encontradas, no solo las que cambiaron
+            client_flags=[ClientFlag.FOUND_ROWS]
+        )
+
+    def _tomar(self):
+        limite = time.monotonic() + self.espera_maxima
+        with self._condicion:
+            while True:
+                if self._libres:
+                    return self._libres.pop()
+                if self._creadas < self.tamano:
+                    self._creadas += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError(f"No hay conexiones libres tras {self.espera_maxima}s de espera.")
+                self._condicion.wait(restante)
+        try:
+            return self._conectar()
+        except Exception:
+            self._liberar_plaza()
+            raise
+
+    def _liberar_plaza(self):
+        with self._condicion:
+            self._creadas -= 1
+            self._condicion.notify()
+
+    def obtener(self):
+        inicio = time.perf_counter()
+        conexion = self._tomar()
+        espera = time.perf_counter() - inicio
+
+        # Chequeo de salud: una conexión caída se reconecta antes de entregarla
+        if not conexion.is_connected():
+            try:
+                conexion.reconnect(attempts=3, delay=0.5)
+            except ERRORES_CONEXION:
+                self.devolver(conexion, descartar=True)
+                raise
+            with self._condicion:
+                self._reconexiones += 1
+
+        with self._condicion:
+            self._prestamos += 1
+            if espera > 0.001:
+                self._esperas += 1
+            self._tiempo_espera_total += espera
+            self._tiempo_espera_max = max(self._tiempo_espera_max, espera)
+        return conexion
+
+    def devolver(self, conexion, descartar=False):
+        if descartar:
+            try:
+                conexion.close()
+            except mysql.connector.Error:
+                pass
+            with self._condicion:
+                self._descartadas += 1
+            self._liberar_plaza()
+            return
+        with self._condicion:
+            self._libres.append(conexion)
+            self._condicion.notify()
+
+    @contextmanager
+    def sesion(self):
+        conexion = self.obtener()
+        rota = False
+        try:
+            cursor = conexion.cursor()
+            try:
+                yield cursor
+                conexion.commit()
+            finally:
+                cursor.close()
+        except ERRORES_CONEXION:
+            rota = True
+            raise
+        except Exception:
+            conexion.rollback()
+            raise
+        finally:
+            self.devolver(conexion, descartar=rota)
+
+    def ejecutar(self, operacion, reintentos=1):
+        # Si la conexión se cae a mitad de la operación, la transacción no llegó
+        # a confirmarse y se repite sobre una conexión nueva.
+        for intento in range(reintentos + 1):
+            try:
+                with self.sesion() as cursor:
+                    return operacion(cursor)
+            except ERRORES_CONEXION:
+                if intento == reintentos:
+                    raise
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                "tamano": self.tamano,
+                "creadas": self._creadas,
+                "libres": len(self._libres),
+                "en_uso": self._creadas - len(self._libres),
+                "prestamos": self._prestamos,
+                "esperas": self._esperas,
+                "espera_promedio": self._tiempo_espera_total / self._prestamos if self._prestamos else 0.0,
+                "espera_maxima": self._tiempo_espera_max,
+                "reconexiones": self._reconexiones,
+                "descartadas": self._descartadas,
+            }
+
+    def cerrar(self):
+        with self._condicion:
+            libres, self._libres = self._libres, []
+            self._creadas -= len(libres)
+        for conexion in libres:
+            try:
+                conexion.close()
+            except mysql.connector.Error:
+                pass
+
 # ========== MYSQL IMPLEMENTATION ============
 class RepositorioMySQL(RepositorioDoctores):
-    def __init__(self, config):
-        self.conexion = mysql.connector.connect(
-            host=config["host"],
-            user=config["user"],
-            password=config["password"],
-            database=config["database"]
-        )
-        self.cursor = self.conexion.cursor()
+    def __init__(self, config, tamano_pool=5, espera_maxima=10.0):
+        self.pool = PoolConexiones(config, tamano_pool, espera_maxima)
         self.crear_tabla_si_no_existe()
 
     def crear_tabla_si_no_existe(self):
-        self.cursor.execute("""
+        self.pool.ejecutar(lambda cursor: cursor.execute("""
             CREATE TABLE IF NOT EXISTS doctores (
                 cedula VARCHAR(20) PRIMARY KEY,
                 nombre VARCHAR(100),
                 especialidad VARCHAR(100)
             )
+        """))
+        self.crear_indices_si_no_existen()
+
+    INDICES = {
+        "idx_doctores_nombre": "CREATE INDEX idx_doctores_nombre ON doctores (nombre(20))",
+        "idx_doctores_especialidad": "CREATE INDEX idx_doctores_especialidad ON doctores (especialidad(20))",
+        "ft_doctores_texto": "CREATE FULLTEXT INDEX ft_doctores_texto ON doctores (nombre, especialidad) WITH PARSER ngram",
+    }
+
+    def crear_indices_si_no_existen(self):
+        # MySQL no admite CREATE INDEX IF NOT EXISTS; se consulta el catálogo
+        def operacion(cursor):
+            cursor.execute(
+                "SELECT DISTINCT index_name FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'doctores'"
+            )
+            existentes = {nombre for (nombre,) in cursor.fetchall()}
+            for nombre, sentencia in self.INDICES.items():
+                if nombre not in existentes:
+                    cursor.execute(sentencia)
+        self.pool.ejecutar(operacion)
+
+    def agregar(self, doctor):
+        try:
+            self.pool.ejecutar(lambda cursor: cursor.execute(
+                "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (%s, %s, %s)",
+                (doctor.cedula, doctor.nombre, doctor.especialidad)
+            ))
+        except mysql.connector.IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise CedulaDuplicada("Ya existe un doctor con esa cédula.") from e
+            raise
+
+    # Una sola sentencia por escritura; rowcount indica si la cédula existía
+    def actualizar(self, cedula, doctor):
+        def operacion(cursor):
+            cursor.execute(
+                "UPDATE doctores SET nombre = %s, especialidad = %s WHERE cedula = %s",
+                (doctor.nombre, doctor.especialidad, cedula)
+            )
+            return cursor.rowcount
+        if self.pool.ejecutar(operacion) == 0:
+            raise DoctorNoEncontrado("No existe un registro con esa cédula.")
+
+    def eliminar(self, cedula):
+        def operacion(cursor):
+            cursor.execute("DELETE FROM doctores WHERE cedula = %s", (cedula,))
+            return cursor.rowcount
+        if self.pool.ejecutar(operacion) == 0:
+            raise DoctorNoEncontrado("No existe un registro con esa cédula.")
+
+    def obtener_todos(self):
+        def operacion(cursor):
+            cursor.execute("SELECT nombre, especialidad, cedula FROM doctores")
+            return cursor.fetchall()
+        registros = self.pool.ejecutar(operacion)
+        return [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
+
+    def existe_cedula(self, cedula):
+        def operacion(cursor):
+            cursor.execute("SELECT 1 FROM doctores WHERE cedula = %s", (cedula,))
+            return cursor.fetchone() is not None
+        return self.pool.ejecutar(operacion)
+
+    def contar(self):
+        def operacion(cursor):
+            cursor.execute("SELECT COUNT(*) FROM doctores")
+            return cursor.fetchone()[0]
+        return self.pool.ejecutar(operacion)
+
+    def obtener_pagina(self, despues_de=None, limite=100):
+        def operacion(cursor):
+            if despues_de is None:
+                cursor.execute(
+                    "SELECT nombre, especialidad, cedula FROM doctores ORDER BY cedula LIMIT %s",
+                    (limite,)
+                )
+            else:
+                cursor.execute(
+                    "SELECT nombre, especialidad, cedula FROM doctores WHERE cedula > %s ORDER BY cedula LIMIT %s",
+                    (despues_de, limite)
+                )
+            return cursor.fetchall()
+        registros = self.pool.ejecutar(operacion)
+        pagina = [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
+        siguiente = pagina[-1].cedula if len(pagina) == limite else None
+        return pagina, siguiente
+
+    def buscar(self, termino, limite=200):
+        termino = termino.strip()
+        if not termino:
+            return self.obtener_pagina(None, limite)[0]
+        patron = termino.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        columnas = "SELECT nombre, especialidad, cedula FROM doctores"
+        # Cada rama usa su propio índice; UNION elimina los duplicados entre ramas
+        consultas = [
+            f"({columnas} WHERE cedula LIKE %s LIMIT %s)",
+            f"({columnas} WHERE nombre LIKE %s LIMIT %s)",
+            f"({columnas} WHERE especialidad LIKE %s LIMIT %s)",
+        ]
+        parametros = [patron, limite, patron, limite, patron, limite]
+        # El parser ngram (tokens de 2 caracteres) resuelve coincidencias a mitad de palabra
+        frase = termino.replace('"', " ").strip()
+        if len(frase) >= 2:
+            consultas.append(f"({columnas} WHERE MATCH(nombre, especialidad) AGAINST (%s IN BOOLEAN MODE) LIMIT %s)")
+            parametros += [f'"{frase}"', limite]
+        sql = " UNION ".join(consultas) + " LIMIT %s"
+        parametros.append(limite)
+
+        def operacion(cursor):
+            cursor.execute(sql, tuple(parametros))
+            return cursor.fetchall()
+        registros = self.pool.ejecutar(operacion)
+        return [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
+
+    # Un commit por lote: executemany se reescribe como INSERT multi-fila
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            filas = [(d.cedula, d.nombre, d.especialidad) for d in lote]
+            try:
+                self.pool.ejecutar(lambda cursor: cursor.executemany(
+                    "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (%s, %s, %s)",
+                    filas
+                ))
+            except mysql.connector.IntegrityError as e:
+                if e.errno == errorcode.ER_DUP_ENTRY:
+                    raise CedulaDuplicada(f"Cédula duplicada en el lote: {e.msg}") from e
+                raise
+            total += len(filas)
+        return total
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            filas = [(d.cedula, d.nombre, d.especialidad) for d in lote]
+            self.pool.ejecutar(lambda cursor: cursor.executemany(
+                "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE nombre = VALUES(nombre), especialidad = VALUES(especialidad)",
+                filas
+            ))
+            total += len(filas)
+        return total
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            filas = [(d.nombre, d.especialidad, d.cedula) for d in lote]
+            def operacion(cursor):
+                cursor.executemany(
+                    "UPDATE doctores SET nombre = %s, especialidad = %s WHERE cedula = %s",
+                    filas
+                )
+                return cursor.rowcount
+            total += self.pool.ejecutar(operacion)
+        return total
+
+    def estadisticas_pool(self):
+        return self.pool.estadisticas()
+
+# ========== SQLITE IMPLEMENTATION ===========
+class RepositorioSQLite(RepositorioDoctores):
+    def __init__(self, ruta="doctores.db"):
+        # sqlite3 reutiliza las sentencias preparadas mientras el texto SQL sea el mismo
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False, cached_statements=256)
+        self._lock = threading.Lock()
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.crear_tabla_si_no_existe()
+
+    def crear_tabla_si_no_existe(self):
+        with self._lock, self.conexion:
+            self.conexion.execute("""
+                CREATE TABLE IF NOT EXISTS doctores (
+                    cedula TEXT PRIMARY KEY,
+                    nombre TEXT,
+                    especialidad TEXT
+                )
+            """)
+            self.conexion.execute("CREATE INDEX IF NOT EXISTS idx_doctores_nombre ON doctores (nombre COLLATE NOCASE)")
+            self.conexion.execute("CREATE INDEX IF NOT EXISTS idx_doctores_especialidad ON doctores (especialidad COLLATE NOCASE)")
+            # LIKE no distingue mayúsculas: solo un índice NOCASE sirve para el prefijo de la cédula
+            self.conexion.execute("CREATE INDEX IF NOT EXISTS idx_doctores_cedula_nocase ON doctores (cedula COLLATE NOCASE)")
+            self.fts = self._crear_fts()
+
+    def _crear_fts(self):
+        existia = self.conexion.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'doctores_fts'"
+        ).fetchone() is not None
+        try:
+            self.conexion.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS doctores_fts USING fts5(
+                    nombre, especialidad, cedula,
+                    content='doctores', content_rowid='rowid', tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError:
+            return False  # SQLite sin FTS5 o sin tokenizador trigram
+        self.conexion.executescript("""
+            CREATE TRIGGER IF NOT EXISTS doctores_ai AFTER INSERT ON doctores BEGIN
+                INSERT INTO doctores_fts (rowid, nombre, especialidad, cedula)
+                VALUES (new.rowid, new.nombre, new.especialidad, new.cedula);
+            END;
+            CREATE TRIGGER IF NOT EXISTS doctores_ad AFTER DELETE ON doctores BEGIN
+                INSERT INTO doctores_fts (doctores_fts, rowid, nombre, especialidad, cedula)
+                VALUES ('delete', old.rowid, old.nombre, old.especialidad, old.cedula);
+            END;
+            CREATE TRIGGER IF NOT EXISTS doctores_au AFTER UPDATE ON doctores BEGIN
+                INSERT INTO doctores_fts (doctores_fts, rowid, nombre, especialidad, cedula)
+                VALUES ('delete', old.rowid, old.nombre, old.especialidad, old.cedula);
+                INSERT INTO doctores_fts (rowid, nombre, especialidad, cedula)
+                VALUES (new.rowid, new.nombre, new.especialidad, new.cedula);
+            END;
         """)
-        self.conexion.commit()
+        if not existia:
+            self.conexion.execute("INSERT INTO doctores_fts (doctores_fts) VALUES ('rebuild')")
+        return True
 
     def agregar(self, doctor):
-        self.cursor.execute(
-            "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (%s, %s, %s)",
-            (doctor.cedula, doctor.nombre, doctor.especialidad)
-        )
-        self.conexion.commit()
+        try:
+            with self._lock, self.conexion:
+                self.conexion.execute(
+                    "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (?, ?, ?)",
+                    (doctor.cedula, doctor.nombre, doctor.especialidad)
+                )
+        except sqlite3.IntegrityError as e:
+            raise CedulaDuplicada("Ya existe un doctor con esa cédula.") from e
 
     def actualizar(self, cedula, doctor):
-        self.cursor.execute("SELECT cedula FROM doctores WHERE cedula = %s", (cedula,))
-        if not self.cursor.fetchone():
-            raise ValueError("No existe un registro con esa cédula.")
-        self.cursor.execute(
-            "UPDATE doctores SET nombre = %s, especialidad = %s WHERE cedula = %s",
-            (doctor.nombre, doctor.especialidad, cedula)
-        )
-        self.conexion.commit()
+        with self._lock, self.conexion:
+            cursor = self.conexion.execute(
+                "UPDATE doctores SET nombre = ?, especialidad = ? WHERE cedula = ?",
+                (doctor.nombre, doctor.especialidad, cedula)
+            )
+        if cursor.rowcount == 0:
+            raise DoctorNoEncontrado("No existe un registro con esa cédula.")
 
     def eliminar(self, cedula):
-        self.cursor.execute("DELETE FROM doctores WHERE cedula = %s", (cedula,))
-        self.conexion.commit()
+        with self._lock, self.conexion:
+            cursor = self.conexion.execute("DELETE FROM doctores WHERE cedula = ?", (cedula,))
+        if cursor.rowcount == 0:
+            raise DoctorNoEncontrado("No existe un registro con esa cédula.")
 
     def obtener_todos(self):
-        self.cursor.execute("SELECT nombre, especialidad, cedula FROM doctores")
-        registros = self.cursor.fetchall()
+        with self._lock:
+            registros = self.conexion.execute("SELECT nombre, especialidad, cedula FROM doctores").fetchall()
+        return [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
+
+    def existe_cedula(self, cedula):
+        with self._lock:
+            return self.conexion.execute("SELECT 1 FROM doctores WHERE cedula = ?", (cedula,)).fetchone() is not None
+
+    def contar(self):
+        with self._lock:
+            return self.conexion.execute("SELECT COUNT(*) FROM doctores").fetchone()[0]
+
+    def _escribir_lote(self, sql, filas_de, doctores, tamano_lote):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            with self._lock, self.conexion:
+                cursor = self.conexion.executemany(sql, [filas_de(d) for d in lote])
+            total += cursor.rowcount
+        return total
+
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        try:
+            return self._escribir_lote(
+                "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (?, ?, ?)",
+                lambda d: (d.cedula, d.nombre, d.especialidad), doctores, tamano_lote
+            )
+        except sqlite3.IntegrityError as e:
+            raise CedulaDuplicada(f"Cédula duplicada en el lote: {e}") from e
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        return self._escribir_lote(
+            "INSERT INTO doctores (cedula, nombre, especialidad) VALUES (?, ?, ?) "
+            "ON CONFLICT (cedula) DO UPDATE SET nombre = excluded.nombre, especialidad = excluded.especialidad",
+            lambda d: (d.cedula, d.nombre, d.especialidad), doctores, tamano_lote
+        )
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        return self._escribir_lote(
+            "UPDATE doctores SET nombre = ?, especialidad = ? WHERE cedula = ?",
+            lambda d: (d.nombre, d.especialidad, d.cedula), doctores, tamano_lote
+        )
+
+    def obtener_pagina(self, despues_de=None, limite=100):
+        with self._lock:
+            if despues_de is None:
+                registros = self.conexion.execute(
+                    "SELECT nombre, especialidad, cedula FROM doctores ORDER BY cedula LIMIT ?", (limite,)
+                ).fetchall()
+            else:
+                registros = self.conexion.execute(
+                    "SELECT nombre, especialidad, cedula FROM doctores WHERE cedula > ? ORDER BY cedula LIMIT ?",
+                    (despues_de, limite)
+                ).fetchall()
+        pagina = [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
+        siguiente = pagina[-1].cedula if len(pagina) == limite else None
+        return pagina, siguiente
+
+    def buscar(self, termino, limite=200):
+        termino = termino.strip()
+        if not termino:
+            return self.obtener_pagina(None, limite)[0]
+        if self.fts and len(termino) >= 3:
+            # El tokenizador trigram resuelve subcadenas de 3 o más caracteres con el índice
+            sql = (
+                "SELECT d.nombre, d.especialidad, d.cedula FROM doctores_fts "
+                "JOIN doctores d ON d.rowid = doctores_fts.rowid "
+                "WHERE doctores_fts MATCH ? LIMIT ?"
+            )
+            parametros = ('"' + termino.replace('"', '""') + '"', limite)
+        else:
+            patron = termino.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            # Un OR entre columnas obliga a recorrer la tabla; cada rama de la UNION usa su índice
+            sql = " UNION ".join(
+                f"SELECT * FROM (SELECT nombre, especialidad, cedula FROM doctores "
+                f"WHERE {columna} LIKE ? ESCAPE '\\' LIMIT ?)"
+                for columna in ("cedula", "nombre", "especialidad")
+            ) + " LIMIT ?"
+            parametros = (patron, limite, patron, limite, patron, limite, limite)
+        with self._lock:
+            registros = self.conexion.execute(sql, parametros).fetchall()
         return [Doctor(nombre, especialidad, cedula) for nombre, especialidad, cedula in registros]
 
+    def cerrar(self):
+        with self._lock:
+            self.conexion.close()
+
+# ========== IN-MEMORY IMPLEMENTATION ========
+class RepositorioMemoria(RepositorioDoctores):
+    def __init__(self):
+        self._doctores = {}
+        self._ordenadas = None
+        self._lock = threading.Lock()
+
+    def agregar(self, doctor):
+        with self._lock:
+            if doctor.cedula in self._doctores:
+                raise CedulaDuplicada("Ya existe un doctor con esa cédula.")
+            self._doctores[doctor.cedula] = Doctor(doctor.nombre, doctor.especialidad, doctor.cedula)
+            self._ordenadas = None
+
+    def actualizar(self, cedula, doctor):
+        with self._lock:
+            if cedula not in self._doctores:
+                raise DoctorNoEncontrado("No existe un registro con esa cédula.")
+            self._doctores[cedula] = Doctor(doctor.nombre, doctor.especialidad, cedula)
+
+    def eliminar(self, cedula):
+        with self._lock:
+            if self._doctores.pop(cedula, None) is None:
+                raise DoctorNoEncontrado("No existe un registro con esa cédula.")
+            self._ordenadas = None
+
+    def obtener_todos(self):
+        with self._lock:
+            return list(self._doctores.values())
+
+    def existe_cedula(self, cedula):
+        return cedula in self._doctores
+
+    def contar(self):
+        return len(self._doctores)
+
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            with self._lock:
+                # Todo o nada por lote, igual que una transacción
+                cedulas = [d.cedula for d in lote]
+                if len(set(cedulas)) != len(cedulas) or any(c in self._doctores for c in cedulas):
+                    raise CedulaDuplicada("Cédula duplicada en el lote.")
+                for d in lote:
+                    self._doctores[d.cedula] = Doctor(d.nombre, d.especialidad, d.cedula)
+                self._ordenadas = None
+            total += len(lote)
+        return total
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        for lote in dividir_en_lotes(doctores, tamano_lote):
+            with self._lock:
+                for d in lote:
+                    self._doctores[d.cedula] = Doctor(d.nombre, d.especialidad, d.cedula)
+                self._ordenadas = None
+            total += len(lote)
+        return total
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        total = 0
+        with self._lock:
+            for d in doctores:
+                if d.cedula in self._doctores:
+                    self._doctores[d.cedula] = Doctor(d.nombre, d.especialidad, d.cedula)
+                    total += 1
+        return total
+
+    def obtener_pagina(self, despues_de=None, limite=100):
+        with self._lock:
+            if self._ordenadas is None:
+                self._ordenadas = sorted(self._doctores)
+            inicio = 0 if despues_de is None else bisect_right(self._ordenadas, despues_de)
+            pagina = [self._doctores[c] for c in self._ordenadas[inicio:inicio + limite]]
+        siguiente = pagina[-1].cedula if len(pagina) == limite else None
+        return pagina, siguiente
+
+    def buscar(self, termino, limite=200):
+        termino = termino.strip().lower()
+        if not termino:
+            return self.obtener_pagina(None, limite)[0]
+        encontrados = []
+        with self._lock:
+            for d in self._doctores.values():
+                if termino in d.nombre.lower() or termino in d.especialidad.lower() or termino in d.cedula.lower():
+                    encontrados.append(d)
+                    if len(encontrados) == limite:
+                        break
+        return encontrados
+
+# ========== CACHE DECORATOR =================
+class RepositorioCache(RepositorioDoctores):
+    def __init__(self, repositorio, ttl=60.0):
+        self.repositorio = repositorio
+        self.ttl = ttl
+        self.version = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.RLock()
+        self._por_cedula = {}
+        self._por_especialidad = {}
+        self._ordenadas = None
+        self._cargado_en = None
+
+    def _indexar(self, doctor):
+        anterior = self._por_cedula.get(doctor.cedula)
+        if anterior is not None:
+            self._desindexar(anterior.cedula)
+        self._por_cedula[doctor.cedula] = doctor
+        self._por_especialidad.setdefault(doctor.especialidad.lower(), set()).add(doctor.cedula)
+        self._ordenadas = None
+
+    def _desindexar(self, cedula):
+        doctor = self._por_cedula.pop(cedula, None)
+        if doctor is None:
+            return
+        cedulas = self._por_especialidad.get(doctor.especialidad.lower())
+        if cedulas is not None:
+            cedulas.discard(cedula)
+            if not cedulas:
+                del self._por_especialidad[doctor.especialidad.lower()]
+        self._ordenadas = None
+
+    def _vigente(self):
+        if self._cargado_en is None or time.monotonic() - self._cargado_en >= self.ttl:
+            self.fallos += 1
+            self._por_cedula = {}
+            self._por_especialidad = {}
+            for doctor in self.repositorio.iterar_todos():
+                self._indexar(doctor)
+            self._cargado_en = time.monotonic()
+        else:
+            self.aciertos += 1
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self._cargado_en = None
+
+    def agregar(self, doctor):
+        self.repositorio.agregar(doctor)
+        with self._lock:
+            if self._cargado_en is not None:
+                self._indexar(doctor)
+
+    def actualizar(self, cedula, doctor):
+        self.repositorio.actualizar(cedula, doctor)
+        with self._lock:
+            if self._cargado_en is not None:
+                self._indexar(Doctor(doctor.nombre, doctor.especialidad, cedula))
+
+    def eliminar(self, cedula):
+        try:
+            self.repositorio.eliminar(cedula)
+        finally:
+            with self._lock:
+                self._desindexar(cedula)
+
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        return self._escribir_lote(self.repositorio.agregar_lote, doctores, tamano_lote)
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        return self._escribir_lote(self.repositorio.upsert_lote, doctores, tamano_lote)
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        return self._escribir_lote(self.repositorio.actualizar_lote, doctores, tamano_lote, solo_existentes=True)
+
+    def _escribir_lote(self, escribir, doctores, tamano_lote, solo_existentes=False):
+        escritos = []
+        def registrar(iterable):
+            for doctor in iterable:
+                escritos.append(doctor)
+                yield doctor
+        try:
+            total = escribir(registrar(doctores), tamano_lote)
+        except Exception:
+            # Un lote a medias deja la caché en un estado desconocido
+            self.invalidar()
+            raise
+        with self._lock:
+            if self._cargado_en is not None:
+                for doctor in escritos:
+                    if not solo_existentes or doctor.cedula in self._por_cedula:
+                        self._indexar(doctor)
+        return total
+
+    def obtener_todos(self):
+        with self._lock:
+            self._vigente()
+            return list(self._por_cedula.values())
+
+    def existe_cedula(self, cedula):
+        with self._lock:
+            self._vigente()
+            return cedula in self._por_cedula
+
+    def contar(self):
+        with self._lock:
+            self._vigente()
+            return len(self._por_cedula)
+
+    def obtener_pagina(self, despues_de=None, limite=100):
+        with self._lock:
+            self._vigente()
+            if self._ordenadas is None:
+                self._ordenadas = sorted(self._por_cedula)
+            inicio = 0 if despues_de is None else bisect_right(self._ordenadas, despues_de)
+            pagina = [self._por_cedula[c] for c in self._ordenadas[inicio:inicio + limite]]
+        siguiente = pagina[-1].cedula if len(pagina) == limite else None
+        return pagina, siguiente
+
+    def buscar(self, termino, limite=200):
+        # Mismo criterio y orden (por cédula) que el recorrido del repositorio envuelto
+        termino = termino.strip().lower()
+        with self._lock:
+            self._vigente()
+            if self._ordenadas is None:
+                self._ordenadas = sorted(self._por_cedula)
+            if not termino:
+                return [self._por_cedula[c] for c in self._ordenadas[:limite]]
+            encontrados = []
+            for d in map(self._por_cedula.get, self._ordenadas):
+                if termino in d.nombre.lower() or termino in d.especialidad.lower() or termino in d.cedula.lower():
+                    encontrados.append(d)
+                    if len(encontrados) == limite:
+                        break
+            return encontrados
+
+    def buscar_por_especialidad(self, especialidad):
+        with self._lock:
+            self._vigente()
+            cedulas = self._por_especialidad.get(especialidad.lower(), ())
+            return [self._por_cedula[c] for c in cedulas]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "version": self.version,
+                "doctores": len(self._por_cedula),
+            }
+
+# ========== CSV IMPORT ======================
+def leer_csv_doctores(ruta):
+    with open(ruta, "r", newline="", encoding="utf-8") as archivo:
+        lector = csv.reader(archivo)
+        next(lector, None)  # encabezado: Nombre, Especialidad, Cédula
+        for fila in lector:
+            if len(fila) < 3 or not all(fila[:3]):
+                continue
+            nombre, especialidad, cedula = (campo.strip() for campo in fila[:3])
+            yield Doctor(nombre, especialidad, cedula)
+
+def importar_csv(repositorio, ruta, tamano_lote=1000):
+    return repositorio.upsert_lote(leer_csv_doctores(ruta), tamano_lote)
+
+# ========== EXPORT ==========================
+class ExportacionCancelada(Exception):
+    pass
+
+FORMATOS_EXPORTACION = (".csv.gz", ".jsonl.gz", ".csv", ".jsonl", ".parquet")
+ENCABEZADO_CSV = ["Nombre", "Especialidad", "Cédula"]
+
+def formato_por_extension(ruta):
+    for extension in FORMATOS_EXPORTACION:
+        if ruta.lower().endswith(extension):
+            return extension.lstrip(".")
+    raise ValueError(f"Formato de exportación no soportado: {ruta}")
+
+def _escribir_texto(archivo, formato, lotes):
+    if formato.startswith("csv"):
+        escritor = csv.writer(archivo)
+        escritor.writerow(ENCABEZADO_CSV)
+        for lote in lotes:
+            escritor.writerows((d.nombre, d.especialidad, d.cedula) for d in lote)
+    else:
+        for lote in lotes:
+            archivo.write("".join(
+                json.dumps({"nombre": d.nombre, "especialidad": d.especialidad, "cedula": d.cedula}, ensure_ascii=False) + "\n"
+                for d in lote
+            ))
+
+def _escribir_parquet(ruta, lotes):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("La exportación a Parquet requiere instalar pyarrow.") from e
+    esquema = pa.schema([("nombre", pa.string()), ("especialidad", pa.string()), ("cedula", pa.string())])
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for lote in lotes:
+            escritor.write_table(pa.table({
+                "nombre": [d.nombre for d in lote],
+                "especialidad": [d.especialidad for d in lote],
+                "cedula": [d.cedula for d in lote],
+            }, schema=esquema))
+
+def exportar_doctores(repositorio, ruta, formato=None, tamano_lote=1000, progreso=None, cancelar=None):
+    formato = formato or formato_por_extension(ruta)
+    if "." + formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    total = repositorio.contar() if progreso else None
+    escritos = 0
+
+    def lotes():
+        nonlocal escritos
+        for lote in dividir_en_lotes(repositorio.iterar_todos(tamano_lote), tamano_lote):
+            if cancelar is not None and cancelar.is_set():
+                raise ExportacionCancelada("Exportación cancelada.")
+            yield lote
+            escritos += len(lote)
+            if progreso:
+                progreso(escritos, total)
+
+    # Se escribe a un temporal del mismo directorio y se renombra al final,
+    # así el archivo destino nunca queda a medio escribir.
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    descriptor, temporal = tempfile.mkstemp(prefix=".exportando-", dir=directorio)
+    os.close(descriptor)
+    try:
+        if formato == "parquet":
+            _escribir_parquet(temporal, lotes())
+        elif formato.endswith(".gz"):
+            with gzip.open(temporal, "wt", newline="", encoding="utf-8") as archivo:
+                _escribir_texto(archivo, formato, lotes())
+        else:
+            with open(temporal, "w", newline="", encoding="utf-8", buffering=1 << 16) as archivo:
+                _escribir_texto(archivo, formato, lotes())
+        os.chmod(temporal, permisos_para(ruta))
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+    return escritos
+
+# ========== ASYNC REPOSITORY ================
+class RepositorioAsincrono:
+    def __init__(self, repositorio, hilos=4):
+        self.repositorio = repositorio
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="repositorio")
+
+    def ejecutar(self, funcion, *args):
+        return self.ejecutor.submit(funcion, *args)
+
+    def agregar(self, doctor):
+        return self.ejecutar(self.repositorio.agregar, doctor)
+
+    def actualizar(self, cedula, doctor):
+        return self.ejecutar(self.repositorio.actualizar, cedula, doctor)
+
+    def eliminar(self, cedula):
+        return self.ejecutar(self.repositorio.eliminar, cedula)
+
+    def obtener_todos(self):
+        return self.ejecutar(self.repositorio.obtener_todos)
+
     def existe_cedula(self, cedula):
-        self.cursor.execute("SELECT 1 FROM doctores WHERE cedula = %s", (cedula,))
-        return self.cursor.fetchone() is not None
+        return self.ejecutar(self.repositorio.existe_cedula, cedula)
+
+    def contar(self):
+        return self.ejecutar(self.repositorio.contar)
+
+    def agregar_lote(self, doctores, tamano_lote=1000):
+        return self.ejecutar(self.repositorio.agregar_lote, doctores, tamano_lote)
+
+    def upsert_lote(self, doctores, tamano_lote=1000):
+        return self.ejecutar(self.repositorio.upsert_lote, doctores, tamano_lote)
+
+    def actualizar_lote(self, doctores, tamano_lote=1000):
+        return self.ejecutar(self.repositorio.actualizar_lote, doctores, tamano_lote)
+
+    def obtener_pagina(self, despues_de=None, limite=100):
+        return self.ejecutar(self.repositorio.obtener_pagina, despues_de, limite)
+
+    def buscar(self, termino, limite=200):
+        return self.ejecutar(self.repositorio.buscar, termino, limite)
+
+    def cerrar(self):
+        self.ejecutor.shutdown(wait=False, cancel_futures=True)
+
+# ========== TABLE VIEW-MODEL ================
+class VistaDoctores:
+    # Mantiene el modelo completo en Python y solo dibuja en el Treeview la
+    # ventana visible. Las filas se identifican por cédula (iid) y cada
+    # redibujo aplica únicamente las altas, bajas y cambios de la ventana.
+    ALTO_ENCABEZADO = 25
+    MARGEN_CARGA = 10
+
+    def __init__(self, tabla, barra, al_acercarse_al_final=None):
+        self.tabla = tabla
+        self.barra = barra
+        self.al_acercarse_al_final = al_acercarse_al_final
+        self.modelo = []
+        self.inicio = 0
+        self.filas_visibles = 20
+        self._mostrados = {}
+        self._orden_mostrado = []
+        self.alto_fila = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+
+        self.barra.config(command=self.desplazar)
+        self.tabla.bind("<Configure>", self._al_redimensionar)
+        self.tabla.bind("<MouseWheel>", lambda e: self.mover(-1 if e.delta > 0 else 1, "units"))
+        self.tabla.bind("<Button-4>", lambda e: self.mover(-1, "units"))
+        self.tabla.bind("<Button-5>", lambda e: self.mover(1, "units"))
+        self.tabla.bind("<Up>", self._al_subir)
+        self.tabla.bind("<Down>", self._al_bajar)
+
+    @staticmethod
+    def _valores(doctor):
+        return (doctor.nombre, doctor.especialidad, doctor.cedula)
+
+    # --- Modelo ---
+    def reemplazar(self, doctores):
+        self.modelo = list(doctores)
+        self.inicio = 0
+        self.renderizar()
+
+    def extender(self, doctores):
+        self.modelo.extend(doctores)
+        self.renderizar()
+
+    def colocar(self, doctor):
+        # El modelo en modo listado está ordenado por cédula
+        for i, actual in enumerate(self.modelo):
+            if actual.cedula == doctor.cedula:
+                self.modelo[i] = doctor
+                break
+        else:
+            self.modelo.insert(bisect_right([d.cedula for d in self.modelo], doctor.cedula), doctor)
+        self.renderizar()
+
+    def quitar(self, cedula):
+        self.modelo = [d for d in self.modelo if d.cedula != cedula]
+        self.renderizar()
+
+    def ultima_cedula(self):
+        return self.modelo[-1].cedula if self.modelo else None
+
+    # --- Desplazamiento ---
+    def desplazar(self, accion, cantidad, unidad=None):
+        if accion == "moveto":
+            self.inicio = int(float(cantidad) * len(self.modelo))
+            self.renderizar()
+        else:
+            self.mover(int(cantidad), unidad)
+
+    def mover(self, cantidad, unidad="units"):
+        paso = self.filas_visibles if unidad == "pages" else 1
+        self.inicio += cantidad * paso
+        self.renderizar()
+        return "break"
+
+    def _al_subir(self, event):
+        foco = self.tabla.focus()
+        if self._orden_mostrado and foco == self._orden_mostrado[0] and self.inicio > 0:
+            self.mover(-1)
+            self.tabla.focus(self._orden_mostrado[0])
+            self.tabla.selection_set(self._orden_mostrado[0])
+            return "break"
+
+    def _al_bajar(self, event):
+        foco = self.tabla.focus()
+        if self._orden_mostrado and foco == self._orden_mostrado[-1]:
+            self.mover(1)
+            self.tabla.focus(self._orden_mostrado[-1])
+            self.tabla.selection_set(self._orden_mostrado[-1])
+            return "break"
+
+    def _al_redimensionar(self, event):
+        filas = max(1, (event.height - self.ALTO_ENCABEZADO) // self.alto_fila)
+        if filas != self.filas_visibles:
+            self.filas_visibles = filas
+            self.renderizar()
+
+    # --- Dibujo ---
+    def renderizar(self):
+        total = len(self.modelo)
+        self.inicio = max(0, min(self.inicio, total - self.filas_visibles))
+        fin = min(total, self.inicio + self.filas_visibles)
+        self._sincronizar(self.modelo[self.inicio:fin])
+        if total:
+            self.barra.set(self.inicio / total, fin / total)
+        else:
+            self.barra.set(0.0, 1.0)
+        if self.al_acercarse_al_final and fin >= total - self.MARGEN_CARGA:
+            self.al_acercarse_al_final()
+
+    def _sincronizar(self, doctores):
+        nuevos = {d.cedula: self._valores(d) for d in doctores}
+        orden_nuevo = list(nuevos)
+
+        eliminados = [c for c in self._orden_mostrado if c not in nuevos]
+        if eliminados:
+            self.tabla.delete(*eliminados)
+        for cedula, valores in nuevos.items():
+            anterior = self._mostrados.get(cedula)
+            if anterior is not None and anterior != valores:
+                self.tabla.item(cedula, values=valores)
+
+        conservados = [c for c in self._orden_mostrado if c in nuevos]
+        en_orden = conservados == [c for c in orden_nuevo if c in self._mostrados]
+        for posicion, cedula in enumerate(orden_nuevo):
+            if cedula not in self._mostrados:
+                self.tabla.insert("", posicion, iid=cedula, values=nuevos[cedula])
+            elif not en_orden:
+                self.tabla.move(cedula, "", posicion)
+
+        self._mostrados = nuevos
+        self._orden_mostrado = orden_nuevo
 
 # ========== TKINTER GUI ======================
+class DialogoProgreso(tk.Toplevel):
+    REFRESCO_MS = 100
+
+    def __init__(self, padre, titulo):
+        super().__init__(padre)
+        self.title(titulo)
+        self.resizable(False, False)
+        self.transient(padre)
+        self.cancelado = threading.Event()
+        self._avance = (0, None)
+
+        self.etiqueta = tk.Label(self, text="Preparando...")
+        self.etiqueta.pack(padx=10, pady=4)
+        self.barra = ttk.Progressbar(self, mode="determinate", length=300, maximum=1.0)
+        self.barra.pack(padx=10, pady=4)
+        tk.Button(self, text="Cancelar", command=self.cancelar).pack(pady=4)
+        self.protocol("WM_DELETE_WINDOW", self.cancelar)
+        self._refresco = self.after(self.REFRESCO_MS, self._refrescar)
+
+    # Se llama desde el hilo de trabajo: solo guarda el avance, sin tocar Tk
+    def reportar(self, escritos, total):
+        self._avance = (escritos, total)
+
+    def cancelar(self):
+        self.cancelado.set()
+        self.etiqueta.config(text="Cancelando...")
+
+    def _refrescar(self):
+        escritos, total = self._avance
+        if not self.cancelado.is_set():
+            if total:
+                self.barra.config(value=min(1.0, escritos / total))
+                self.etiqueta.config(text=f"{escritos} de {total} doctores")
+            elif escritos:
+                self.etiqueta.config(text=f"{escritos} doctores")
+        self._refresco = self.after(self.REFRESCO_MS, self._refrescar)
+
+    def destroy(self):
+        self.after_cancel(self._refresco)
+        super().destroy()
+
 class AplicacionDoctores(tk.Tk):
+    TAMANO_PAGINA = 100
+    LIMITE_BUSQUEDA = 200
+    ESPERA_BUSQUEDA_MS = 300
+    SONDEO_MS = 50
+
     def __init__(self, repositorio):
         super().__init__()
         self.repositorio = repositorio
+        self.asincrono = RepositorioAsincrono(repositorio)
+        self._cursor_pagina = None
+        self._hay_mas = False
+        self._generacion_tabla = 0
+        self._busqueda_pendiente = None
+        self._busqueda_en_curso = None
+        self._tareas_activas = 0
         self.title("Gestión de Doctores")
         self.geometry("520x550")
+        self.protocol("WM_DELETE_WINDOW", self.cerrar)
 
         self.nombre_var = tk.StringVar()
         self.especialidad_var = tk.StringVar()
@@ -116,6 +1201,11 @@ class AplicacionDoctores(tk.Tk):
         tk.Button(self, text="Eliminar Doctor", command=self.eliminar_doctor).pack(pady=2)
         tk.Button(self, text="Refrescar Tabla", command=self.mostrar_todos).pack(pady=2)
         tk.Button(self, text="Exportar CSV", command=self.exportar_csv).pack(pady=2)
+        tk.Button(self, text="Importar CSV", command=self.importar_csv).pack(pady=2)
+
+        # Indicador de actividad
+        self.indicador = ttk.Progressbar(self, mode="indeterminate", length=200)
+        self.indicador.pack(pady=2)
 
         # Buscador
         tk.Label(self, text="Buscar").pack()
@@ -126,14 +1216,53 @@ class AplicacionDoctores(tk.Tk):
 
         # Tabla
         columnas = ("nombre", "especialidad", "cedula")
-        self.tabla = ttk.Treeview(self, columns=columnas, show="headings")
+        marco_tabla = tk.Frame(self)
+        marco_tabla.pack(fill=tk.BOTH, expand=True)
+        self.barra = ttk.Scrollbar(marco_tabla, orient="vertical")
+        self.barra.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tabla = ttk.Treeview(marco_tabla, columns=columnas, show="headings")
         for col in columnas:
             self.tabla.heading(col, text=col.capitalize())
         self.tabla.pack(fill=tk.BOTH, expand=True)
         self.tabla.bind("<<TreeviewSelect>>", self.seleccionar_fila)
+        self.vista = VistaDoctores(self.tabla, self.barra, al_acercarse_al_final=self.al_acercarse_al_final)
 
         self.mostrar_todos()
 
+    # Tk no es seguro entre hilos: el resultado de cada futuro se sondea con
+    # after() y los callbacks siempre corren en el hilo principal.
+    def en_segundo_plano(self, futuro, al_terminar, al_fallar=None):
+        self._marcar_ocupado(1)
+        def revisar():
+            if not futuro.done():
+                self.after(self.SONDEO_MS, revisar)
+                return
+            self._marcar_ocupado(-1)
+            if futuro.cancelled():
+                return
+            error = futuro.exception()
+            if error is None:
+                al_terminar(futuro.result())
+            elif al_fallar is not None:
+                al_fallar(error)
+            else:
+                messagebox.showerror("Error", str(error))
+        self.after(self.SONDEO_MS, revisar)
+        return futuro
+
+    def _marcar_ocupado(self, delta):
+        self._tareas_activas += delta
+        if self._tareas_activas > 0:
+            self.indicador.start(10)
+            self.config(cursor="watch")
+        else:
+            self.indicador.stop()
+            self.config(cursor="")
+
+    def cerrar(self):
+        self.asincrono.cerrar()
+        self.destroy()
+
     def limpiar_campos(self):
         self.nombre_var.set("")
         self.especialidad_var.set("")
@@ -145,49 +1274,76 @@ class AplicacionDoctores(tk.Tk):
         if not doctor.nombre or not doctor.especialidad or not doctor.cedula:
             messagebox.showwarning("Campos incompletos", "Por favor completa todos los campos.")
             return
-        if self.repositorio.existe_cedula(doctor.cedula):
-            messagebox.showerror("Error", "Ya existe un doctor con esa cédula.")
-            return
-        try:
-            self.repositorio.agregar(doctor)
+        def al_terminar(_):
             messagebox.showinfo("Agregado", "Doctor agregado correctamente.")
             self.limpiar_campos()
-            self.mostrar_todos()
-        except mysql.connector.Error as e:
-            messagebox.showerror("Error", str(e))
+            self.reflejar_cambio(doctor)
+        self.en_segundo_plano(self.asincrono.agregar(doctor), al_terminar)
 
     def actualizar_doctor(self):
         doctor = Doctor(self.nombre_var.get(), self.especialidad_var.get(), self.cedula_var.get())
         if not doctor.nombre or not doctor.especialidad or not doctor.cedula:
             messagebox.showwarning("Campos incompletos", "Por favor completa todos los campos.")
             return
-        try:
-            self.repositorio.actualizar(doctor.cedula, doctor)
+        def al_terminar(_):
             messagebox.showinfo("Actualizado", "Doctor actualizado correctamente.")
             self.limpiar_campos()
-            self.mostrar_todos()
-        except ValueError as ve:
-            messagebox.showwarning("Advertencia", str(ve))
-        except mysql.connector.Error as e:
-            messagebox.showerror("Error", str(e))
+            self.reflejar_cambio(doctor)
+        def al_fallar(error):
+            if isinstance(error, ValueError):
+                messagebox.showwarning("Advertencia", str(error))
+            else:
+                messagebox.showerror("Error", str(error))
+        self.en_segundo_plano(self.asincrono.actualizar(doctor.cedula, doctor), al_terminar, al_fallar)
 
     def eliminar_doctor(self):
         cedula = self.cedula_var.get()
         if not cedula:
             messagebox.showwarning("Cédula vacía", "Selecciona o escribe una cédula válida.")
             return
-        try:
-            self.repositorio.eliminar(cedula)
+        def al_terminar(_):
             messagebox.showinfo("Eliminado", "Doctor eliminado correctamente.")
             self.limpiar_campos()
-            self.mostrar_todos()
-        except mysql.connector.Error as e:
-            messagebox.showerror("Error", str(e))
+            self.vista.quitar(cedula)
+        def al_fallar(error):
+            if isinstance(error, DoctorNoEncontrado):
+                messagebox.showwarning("Advertencia", str(error))
+            else:
+                messagebox.showerror("Error", str(error))
+        self.en_segundo_plano(self.asincrono.eliminar(cedula), al_terminar, al_fallar)
 
     def mostrar_todos(self):
-        self.tabla.delete(*self.tabla.get_children())
-        for doctor in self.repositorio.obtener_todos():
-            self.tabla.insert("", "end", values=(doctor.nombre, doctor.especialidad, doctor.cedula))
+        # Cada recarga invalida las páginas que aún estén en vuelo
+        self._generacion_tabla += 1
+        self._cursor_pagina = None
+        self.cargar_siguiente_pagina(reemplazar=True)
+
+    def cargar_siguiente_pagina(self, reemplazar=False):
+        generacion = self._generacion_tabla
+        self._hay_mas = False
+        def al_terminar(resultado):
+            if generacion != self._generacion_tabla:
+                return
+            doctores, self._cursor_pagina = resultado
+            self._hay_mas = self._cursor_pagina is not None
+            if reemplazar:
+                self.vista.reemplazar(doctores)
+            else:
+                self.vista.extender(doctores)
+        self.en_segundo_plano(self.asincrono.obtener_pagina(self._cursor_pagina, self.TAMANO_PAGINA), al_terminar)
+
+    def al_acercarse_al_final(self):
+        # Se pide la siguiente página cuando el usuario se acerca al final
+        if self._hay_mas:
+            self._hay_mas = False
+            self.after_idle(self.cargar_siguiente_pagina)
+
+    def reflejar_cambio(self, doctor):
+        if self.buscar_var.get().strip():
+            self.ejecutar_busqueda()
+        elif not self._hay_mas or doctor.cedula <= self.vista.ultima_cedula():
+            # Si la cédula cae después de lo cargado, llegará con su página
+            self.vista.colocar(doctor)
 
     def seleccionar_fila(self, event):
         seleccion = self.tabla.focus()
@@ -199,29 +1355,85 @@ class AplicacionDoctores(tk.Tk):
             self.cedula_entry.config(state="disabled")
 
     def buscar_doctores(self, event):
-        termino = self.buscar_var.get().lower()
-        doctores = self.repositorio.obtener_todos()
-        filtrados = [d for d in doctores if termino in d.nombre.lower() or termino in d.especialidad.lower() or termino in d.cedula.lower()]
+        # Debounce: solo se consulta cuando el usuario deja de teclear
+        if self._busqueda_pendiente is not None:
+            self.after_cancel(self._busqueda_pendiente)
+        self._busqueda_pendiente = self.after(self.ESPERA_BUSQUEDA_MS, self.ejecutar_busqueda)
 
-        self.tabla.delete(*self.tabla.get_children())
-        for doctor in filtrados:
-            self.tabla.insert("", "end", values=(doctor.nombre, doctor.especialidad, doctor.cedula))
+    def ejecutar_busqueda(self):
+        self._busqueda_pendiente = None
+        # Una búsqueda nueva deja obsoleta a la anterior
+        if self._busqueda_en_curso is not None:
+            self._busqueda_en_curso.cancel()
+            self._busqueda_en_curso = None
+        termino = self.buscar_var.get().strip()
+        if not termino:
+            self.mostrar_todos()
+            return
+        self._generacion_tabla += 1
+        generacion = self._generacion_tabla
+        self._hay_mas = False
+        def al_terminar(filtrados):
+            if generacion != self._generacion_tabla:
+                return
+            self._busqueda_en_curso = None
+            self.vista.reemplazar(filtrados)
+        self._busqueda_en_curso = self.en_segundo_plano(
+            self.asincrono.buscar(termino, self.LIMITE_BUSQUEDA), al_terminar
+        )
 
     def exportar_csv(self):
-        doctores = self.repositorio.obtener_todos()
-        try:
-            with open("doctores.csv", "w", newline="", encoding="utf-8") as archivo:
-                escritor = csv.writer(archivo)
-                escritor.writerow(["Nombre", "Especialidad", "Cédula"])
-                for d in doctores:
-                    escritor.writerow([d.nombre, d.especialidad, d.cedula])
-            messagebox.showinfo("Exportado", "Archivo CSV generado correctamente.")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        ruta = filedialog.asksaveasfilename(
+            initialfile="doctores.csv",
+            defaultextension=".csv",
+            filetypes=[
+                ("CSV", "*.csv"),
+                ("CSV comprimido", "*.csv.gz"),
+                ("JSON Lines", "*.jsonl"),
+                ("JSON Lines comprimido", "*.jsonl.gz"),
+                ("Parquet", "*.parquet"),
+            ]
+        )
+        if not ruta:
+            return
+        dialogo = DialogoProgreso(self, "Exportando doctores")
+        def al_terminar(total):
+            dialogo.destroy()
+            messagebox.showinfo("Exportado", f"{total} doctores exportados a {os.path.basename(ruta)}.")
+        def al_fallar(error):
+            dialogo.destroy()
+            if not isinstance(error, ExportacionCancelada):
+                messagebox.showerror("Error", str(error))
+        futuro = self.asincrono.ejecutar(
+            exportar_doctores, self.repositorio, ruta, None, 1000, dialogo.reportar, dialogo.cancelado
+        )
+        self.en_segundo_plano(futuro, al_terminar, al_fallar)
+
+    def importar_csv(self):
+        ruta = filedialog.askopenfilename(filetypes=[("CSV", "*.csv")])
+        if not ruta:
+            return
+        def al_terminar(total):
+            messagebox.showinfo("Importado", f"{total} doctores importados correctamente.")
+            self.mostrar_todos()
+        self.en_segundo_plano(self.asincrono.ejecutar(importar_csv, self.repositorio, ruta), al_terminar)
 
 # ========== MAIN ============================
+def crear_repositorio(config):
+    backend = config.get("backend", "mysql")
+    if backend == "sqlite":
+        return RepositorioSQLite(config.get("ruta", "doctores.db"))
+    if backend == "memoria":
+        return RepositorioMemoria()
+    repositorio = RepositorioMySQL(config)
+    # La caché carga la tabla completa en memoria y busca recorriéndola: solo
+    # conviene con tablas chicas, así que se activa explícitamente (cache=si).
+    if config.get("cache", "no").lower() in ("si", "sí", "1", "true"):
+        return RepositorioCache(repositorio, float(config.get("cache_ttl", 60)))
+    return repositorio
+
 if __name__ == "__main__":
     config = cargar_configuracion()
-    repositorio = RepositorioMySQL(config)
+    repositorio = crear_repositorio(config)
     app = AplicacionDoctores(repositorio)
     app.mainloop()
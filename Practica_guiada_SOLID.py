@@ -1,21 +1,94 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+
+CENTAVO = Decimal("0.01")
+
+def a_centavos(monto):
+    # str() evita arrastrar el error binario de los float (35.1 -> 3510, no 3509)
+    return int((Decimal(str(monto)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def a_decimal(centavos):
+    return Decimal(centavos).scaleb(-2)
 
 
 class Producto:
     def __init__(self, nombre, precio):
         self.nombre = nombre
         self.precio = precio
+        self.centavos = a_centavos(precio)
+
+
+class LineaPedido:
+    __slots__ = ("producto", "cantidad")
+
+    def __init__(self, producto, cantidad=0):
+        self.producto = producto
+        self.cantidad = cantidad
+
+    @property
+    def subtotal_centavos(self):
+        return self.producto.centavos * self.cantidad
+
+
+InstantaneaPedido = namedtuple("InstantaneaPedido", ["lineas", "total_centavos"])
 
 
 class Pedido:
+    # El total se mantiene en centavos enteros y se actualiza al agregar o quitar,
+    # así calcular_total no recorre las líneas en cada escaneo.
     def __init__(self):
-        self.productos = []
-
-    def agregar_producto(self, producto: Producto):
-        self.productos.append(producto)
+        self.lineas = {}
+        self._total_centavos = 0
+        self._instantanea = None
+
+    @property
+    def productos(self):
+        return [linea.producto for linea in self.lineas.values() for _ in range(linea.cantidad)]
+
+    def agregar_producto(self, producto: Producto, cantidad=1):
+        if cantidad <= 0:
+            raise ValueError("La cantidad debe ser positiva.")
+        clave = (producto.nombre, producto.centavos)
+        linea = self.lineas.get(clave)
+        if linea is None:
+            linea = self.lineas[clave] = LineaPedido(producto)
+        linea.cantidad += cantidad
+        self._total_centavos += producto.centavos * cantidad
+        self._instantanea = None
+
+    def quitar_producto(self, producto: Producto, cantidad=1):
+        clave = (producto.nombre, producto.centavos)
+        linea = self.lineas.get(clave)
+        if linea is None or not 0 < cantidad <= linea.cantidad:
+            raise ValueError(f"No hay {cantidad} de {producto.nombre} en el pedido.")
+        linea.cantidad -= cantidad
+        if linea.cantidad == 0:
+            del self.lineas[clave]
+        self._total_centavos -= producto.centavos * cantidad
+        self._instantanea = None
+
+    def vaciar(self):
+        self.lineas.clear()
+        self._total_centavos = 0
+        self._instantanea = None
+
+    @property
+    def total_centavos(self):
+        return self._total_centavos
 
     def calcular_total(self) :
-        return sum(p.precio for p in self.productos)
+        return a_decimal(self._total_centavos)
+
+    def instantanea(self):
+        # Copia inmutable para el ticket; se reutiliza mientras el pedido no cambie
+        if self._instantanea is None:
+            self._instantanea = InstantaneaPedido(
+                tuple((l.producto.nombre, l.producto.centavos, l.cantidad) for l in self.lineas.values()),
+                self._total_centavos,
+            )
+        return self._instantanea
 
 
 class PreparaCafe(ABC):
@@ -76,7 +149,7 @@ class DescuentoFidelidad:
     def aplicar(self, total, tiene_tarjeta):
         if tiene_tarjeta:
             print("Descuento de fidelidad aplicado (10%)")
-            return total * 0.9
+            return (total * Decimal("0.9")).quantize(CENTAVO, rounding=ROUND_HALF_UP)
         return total
 
 
@@ -92,8 +165,8 @@ class Cafeteria:
         self.caja = caja
         self.descuento = descuento
 
-    def agregar_producto(self, producto: Producto):
-        self.pedido.agregar_producto(producto)
+    def agregar_producto(self, producto: Producto, cantidad=1):
+        self.pedido.agregar_producto(producto, cantidad)
 
     def atender_cliente(self, tiene_tarjeta= False):
      
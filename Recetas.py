@@ -1,22 +1,375 @@
+import csv
+import io
+import os
+import string
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, starmap
+
 from doctores import Doctor
 from pacientes import Paciente
+from persistencia import permisos_para
+
+def normalizar_medicamento(nombre):
+    # Los nombres se internan: miles de recetas comparten la misma cadena
+    return sys.intern(" ".join(nombre.split()))
+
+def clave_medicamento(nombre):
+    return nombre.casefold()
+
+def clave_paciente(paciente):
+    return paciente.id
 
 class Receta:
-    def __init__(self, receta_id, paciente, doctor, medicacion):
+    def __init__(self, receta_id, paciente, doctor, medicacion, activa=True):
         self.receta_id = receta_id
         self.paciente = paciente
         self.doctor = doctor
-        self.medicacion = medicacion
+        self.medicacion = tuple(normalizar_medicamento(m) for m in medicacion)
+        self.activa = activa
+        self._detalle = None
 
     def detalle(self):
-        return (
-            f"Receta {self.receta_id}: paciente {self.paciente.nombre}, "
-            f"doctor {self.doctor.nombre}, medicación: {', '.join(self.medicacion)}"
-        )
+        # La medicación es inmutable, así que el texto se arma una sola vez
+        if self._detalle is None:
+            self._detalle = (
+                f"Receta {self.receta_id}: paciente {self.paciente.nombre}, "
+                f"doctor {self.doctor.nombre}, medicación: {', '.join(self.medicacion)}"
+            )
+        return self._detalle
+
+# Almacén de recetas con búsqueda O(1) por id e índices secundarios.
+# Cada índice guarda un dict receta_id -> Receta, que sirve de conjunto ordenado
+# y permite quitar una receta sin recorrer la lista.
+class AlmacenRecetas:
+    def __init__(self):
+        self._por_id = {}
+        # Clave de paciente usada al indexar: si el paciente recibe un id después, se sigue encontrando
+        self._clave_paciente = {}
+        self._por_paciente = {}
+        self._activas_por_paciente = {}
+        self._por_doctor = {}
+        self._por_medicamento = {}
+
+    def __len__(self):
+        return len(self._por_id)
+
+    def __contains__(self, receta_id):
+        return receta_id in self._por_id
+
+    @staticmethod
+    def _indexar(indice, clave, receta):
+        indice.setdefault(clave, {})[receta.receta_id] = receta
+
+    @staticmethod
+    def _desindexar(indice, clave, receta_id):
+        grupo = indice.get(clave)
+        if grupo is not None:
+            grupo.pop(receta_id, None)
+            if not grupo:
+                del indice[clave]
+
+    def agregar(self, receta):
+        if receta.receta_id in self._por_id:
+            raise ValueError(f"Ya existe la receta {receta.receta_id}.")
+        # Sin id no hay clave estable: ni el nombre (homónimos) ni el objeto (el id
+        # puede asignarse después y de_paciente dejaría de encontrar sus recetas)
+        if receta.paciente.id is None:
+            raise ValueError(f"La receta {receta.receta_id} es de un paciente sin id.")
+        self._por_id[receta.receta_id] = receta
+        paciente = self._clave_paciente[receta.receta_id] = clave_paciente(receta.paciente)
+        self._indexar(self._por_paciente, paciente, receta)
+        if receta.activa:
+            self._indexar(self._activas_por_paciente, paciente, receta)
+        self._indexar(self._por_doctor, receta.doctor.cedula, receta)
+        for medicamento in set(map(clave_medicamento, receta.medicacion)):
+            self._indexar(self._por_medicamento, medicamento, receta)
+
+    def eliminar(self, receta_id):
+        receta = self._por_id.pop(receta_id, None)
+        if receta is None:
+            raise KeyError(f"No existe la receta {receta_id}.")
+        paciente = self._clave_paciente.pop(receta_id)
+        self._desindexar(self._por_paciente, paciente, receta_id)
+        self._desindexar(self._activas_por_paciente, paciente, receta_id)
+        self._desindexar(self._por_doctor, receta.doctor.cedula, receta_id)
+        for medicamento in set(map(clave_medicamento, receta.medicacion)):
+            self._desindexar(self._por_medicamento, medicamento, receta_id)
+        return receta
+
+    def desactivar(self, receta_id):
+        receta = self._por_id[receta_id]
+        receta.activa = False
+        self._desindexar(self._activas_por_paciente, self._clave_paciente[receta_id], receta_id)
+
+    def obtener(self, receta_id):
+        return self._por_id.get(receta_id)
+
+    def de_paciente(self, paciente, solo_activas=False):
+        indice = self._activas_por_paciente if solo_activas else self._por_paciente
+        return list(indice.get(clave_paciente(paciente), {}).values())
+
+    def activas_de(self, paciente):
+        return self.de_paciente(paciente, solo_activas=True)
+
+    def de_doctor(self, doctor):
+        return list(self._por_doctor.get(doctor.cedula, {}).values())
+
+    def con_medicamento(self, nombre):
+        return list(self._por_medicamento.get(clave_medicamento(nombre), {}).values())
+
+    def grupos_activos(self):
+        # Recetas activas agrupadas por paciente
+        for recetas in self._activas_por_paciente.values():
+            yield recetas.values()
+
+    def todas(self):
+        return list(self._por_id.values())
+
+# Verificador de interacciones entre medicamentos.
+# Cada medicamento conocido recibe un id entero; sus interacciones se guardan
+# como una máscara de bits (un int de Python), así que cruzar una receta con
+# todo el historial activo del paciente es un AND entre dos enteros.
+class Interaccion:
+    __slots__ = ("receta_id", "medicamento", "con", "severidad", "descripcion")
+
+    def __init__(self, receta_id, medicamento, con, severidad, descripcion):
+        self.receta_id = receta_id
+        self.medicamento = medicamento
+        self.con = con
+        self.severidad = severidad
+        self.descripcion = descripcion
+
+    def __repr__(self):
+        return f"Interaccion({self.medicamento} + {self.con}: {self.severidad})"
+
+class VerificadorInteracciones:
+    def __init__(self, interacciones=()):
+        self._ids = {}
+        self._nombres = []
+        self._adyacencia = []
+        self._detalles = {}
+        for a, b, severidad, descripcion in interacciones:
+            self.registrar(a, b, severidad, descripcion)
+
+    @classmethod
+    def desde_csv(cls, ruta):
+        # Columnas: medicamento_a, medicamento_b, severidad, descripcion
+        with open(ruta, newline="", encoding="utf-8") as archivo:
+            return cls(
+                (f["medicamento_a"], f["medicamento_b"], f.get("severidad", ""), f.get("descripcion", ""))
+                for f in csv.DictReader(archivo)
+            )
+
+    def _id(self, nombre):
+        clave = clave_medicamento(normalizar_medicamento(nombre))
+        i = self._ids.get(clave)
+        if i is None:
+            i = self._ids[clave] = len(self._nombres)
+            self._nombres.append(normalizar_medicamento(nombre))
+            self._adyacencia.append(0)
+        return i
+
+    def registrar(self, a, b, severidad="", descripcion=""):
+        i, j = self._id(a), self._id(b)
+        self._adyacencia[i] |= 1 << j
+        self._adyacencia[j] |= 1 << i
+        self._detalles[(min(i, j), max(i, j))] = (severidad, descripcion)
+
+    def mascara(self, medicacion):
+        # Los medicamentos sin interacciones registradas no aportan bits
+        m = 0
+        for nombre in medicacion:
+            i = self._ids.get(clave_medicamento(nombre))
+            if i is not None:
+                m |= 1 << i
+        return m
+
+    def _cruzar(self, receta_id, propia, otras, conflictos):
+        # Interacciones de cada bit de "propia" contra "otras"
+        while propia:
+            bajo = propia & -propia
+            i = bajo.bit_length() - 1
+            propia ^= bajo
+            choques = self._adyacencia[i] & otras
+            while choques:
+                bit = choques & -choques
+                j = bit.bit_length() - 1
+                choques ^= bit
+                severidad, descripcion = self._detalles[(min(i, j), max(i, j))]
+                conflictos.append(
+                    Interaccion(receta_id, self._nombres[i], self._nombres[j], severidad, descripcion)
+                )
+
+    def _internas(self, receta_id, mascara, conflictos):
+        # Pares dentro de la misma receta, cada uno una sola vez
+        previas = 0
+        while mascara:
+            bit = mascara & -mascara
+            mascara ^= bit
+            self._cruzar(receta_id, bit, previas, conflictos)
+            previas |= bit
+
+    def verificar(self, receta, almacen=None):
+        """Interacciones de una receta consigo misma y con la medicación activa del paciente."""
+        conflictos = []
+        propia = self.mascara(receta.medicacion)
+        if not propia:
+            return conflictos
+        self._internas(receta.receta_id, propia, conflictos)
+        if almacen is not None:
+            historial = 0
+            for otra in almacen.activas_de(receta.paciente):
+                if otra.receta_id != receta.receta_id:
+                    historial |= self.mascara(otra.medicacion)
+            self._cruzar(receta.receta_id, propia, historial, conflictos)
+        return conflictos
+
+    def auditar(self, almacen):
+        """Revisa todas las recetas activas; devuelve {receta_id: [Interaccion, ...]}."""
+        resultado = {}
+        for recetas in almacen.grupos_activos():
+            # Cada receta se cruza con las anteriores del mismo paciente,
+            # así cada par aparece una sola vez
+            acumulada = 0
+            for receta in recetas:
+                propia = self.mascara(receta.medicacion)
+                if not propia:
+                    continue
+                conflictos = []
+                self._internas(receta.receta_id, propia, conflictos)
+                self._cruzar(receta.receta_id, propia, acumulada, conflictos)
+                if conflictos:
+                    resultado[receta.receta_id] = conflictos
+                acumulada |= propia
+        return resultado
+
+# Renderizado masivo de recetas.
+# Cada receta se reduce a una tupla de campos y los bloques se formatean con una
+# plantilla posicional ya compilada, de modo que por registro solo se crea la
+# tupla y el texto final. Con procesos > 1 los bloques se reparten en un pool,
+# pero la tupla se sigue armando en este proceso y el envío de bloques cuesta
+# más que el formateo que se delega: no se activa solo.
+CAMPOS_RECETA = ("receta_id", "paciente", "doctor", "cedula", "medicacion", "estado")
+PLANTILLA_TEXTO = "Receta {receta_id}: paciente {paciente}, doctor {doctor}, medicación: {medicacion}\n"
+# Una receta por página; el salto de página (\f) lo respetan las herramientas de impresión y de PDF
+PLANTILLA_IMPRESION = (
+    "RECETA MÉDICA N.º {receta_id}\n"
+    "Paciente: {paciente}\n"
+    "Doctor: {doctor} (cédula {cedula})\n"
+    "Medicación: {medicacion}\n"
+    "Estado: {estado}\n"
+    "\f"
+)
+
+def compilar_plantilla(plantilla):
+    """Convierte los campos con nombre de la plantilla en índices de CAMPOS_RECETA."""
+    partes = []
+    for literal, campo, formato, conversion in string.Formatter().parse(plantilla):
+        partes.append(literal.replace("{", "{{").replace("}", "}}"))
+        if campo is None:
+            continue
+        if campo not in CAMPOS_RECETA:
+            raise ValueError(f"Campo desconocido en la plantilla: {campo}")
+        partes.append("{" + str(CAMPOS_RECETA.index(campo)))
+        if conversion:
+            partes.append("!" + conversion)
+        if formato:
+            partes.append(":" + formato)
+        partes.append("}")
+    return "".join(partes)
+
+def fila_receta(receta):
+    return (
+        receta.receta_id, receta.paciente.nombre, receta.doctor.nombre, receta.doctor.cedula,
+        ", ".join(receta.medicacion), "activa" if receta.activa else "inactiva",
+    )
+
+def _renderizar_bloque(plantilla, filas):
+    # plantilla None indica CSV
+    if plantilla is None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(filas)
+        return buffer.getvalue()
+    return "".join(starmap(plantilla.format, filas))
+
+def _bloques(recetas, tamano_lote):
+    iterador = iter(recetas)
+    while True:
+        bloque = [fila_receta(r) for r in islice(iterador, tamano_lote)]
+        if not bloque:
+            return
+        yield bloque
+
+def renderizar_recetas(recetas, ruta, formato=None, plantilla=None, tamano_lote=2000, procesos=1):
+    """Escribe recetas en formato txt, csv o plantilla (texto listo para imprimir o PDF).
+
+    procesos > 1 reparte el formateo en un pool de procesos; en las mediciones
+    hechas no compensa el costo de enviar los bloques, por eso no es el valor
+    por defecto.
+    """
+    formato = formato or ("csv" if ruta.lower().endswith(".csv") else "txt" if plantilla is None else "plantilla")
+    if formato == "csv":
+        compilada = None
+    elif formato == "txt":
+        compilada = compilar_plantilla(plantilla or PLANTILLA_TEXTO)
+    elif formato == "plantilla":
+        compilada = compilar_plantilla(plantilla or PLANTILLA_IMPRESION)
+    else:
+        raise ValueError(f"Formato de recetas no soportado: {formato}")
+    escritas = 0
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    descriptor, temporal = tempfile.mkstemp(prefix=".renderizando-", dir=directorio)
+    os.close(descriptor)
+    try:
+        with open(temporal, "w", newline="", encoding="utf-8", buffering=1 << 20) as archivo:
+            if compilada is None:
+                csv.writer(archivo).writerow(CAMPOS_RECETA)
+            if procesos <= 1:
+                for bloque in _bloques(recetas, tamano_lote):
+                    archivo.write(_renderizar_bloque(compilada, bloque))
+                    escritas += len(bloque)
+            else:
+                # Ventana acotada de bloques en vuelo; se escriben en el orden original
+                with ProcessPoolExecutor(max_workers=procesos) as pool:
+                    pendientes = deque()
+                    for bloque in _bloques(recetas, tamano_lote):
+                        pendientes.append(pool.submit(_renderizar_bloque, compilada, bloque))
+                        escritas += len(bloque)
+                        if len(pendientes) >= procesos * 2:
+                            archivo.write(pendientes.popleft().result())
+                    while pendientes:
+                        archivo.write(pendientes.popleft().result())
+        os.chmod(temporal, permisos_para(ruta))
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+    return escritas
 
 if __name__ == "__main__":
-    doc = Doctor(101, "García", "Cardiología")
-    p = Paciente(501, "María", 45)
+    doc = Doctor("García", "Cardiología", "101")
+    p = Paciente("María", 45, "hipertensión")
+    p.id = 501
     r = Receta(9001, p, doc, ["Aspirina", "Vitamina C"])
     print(r.detalle())
- 
\ No newline at end of file
+
+    almacen = AlmacenRecetas()
+    almacen.agregar(r)
+    almacen.agregar(Receta(9002, p, doc, ["Losartán"]))
+    almacen.desactivar(9001)
+    print("Activas de María:", [x.receta_id for x in almacen.activas_de(p)])
+    print("Con aspirina:", [x.receta_id for x in almacen.con_medicamento("aspirina")])
+
+    verificador = VerificadorInteracciones([
+        ("Aspirina", "Warfarina", "alta", "riesgo de sangrado"),
+        ("Losartán", "Espironolactona", "media", "hiperpotasemia"),
+    ])
+    nueva = Receta(9003, p, doc, ["Espironolactona", "Warfarina"])
+    print("Interacciones de 9003:", verificador.verificar(nueva, almacen))
+    almacen.agregar(nueva)
+    print("Auditoría:", verificador.auditar(almacen))
+
+    print("Recetas impresas:", renderizar_recetas(almacen.todas(), "recetas_impresion.txt", formato="plantilla"))
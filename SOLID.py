@@ -1,21 +1,210 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import deque, namedtuple
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from persistencia import EscritorPorLotes, EscrituraError, anexar_sincronizado
+
+
+def a_centavos(monto):
+    # str() evita arrastrar el error binario de los float (35.1 -> 3510, no 3509)
+    return int((Decimal(str(monto)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def a_decimal(centavos):
+    return Decimal(centavos).scaleb(-2)
 
 
 class Producto:
-    def __init__(self, nombre, precio):
+    # tipo indica qué máquina lo prepara ("cafe", "te", "jugo", "tostada"); None = cualquier bebida
+    def __init__(self, nombre, precio, tipo=None):
         self.nombre = nombre
         self.precio = precio
+        self.centavos = a_centavos(precio)
+        self.tipo = tipo
+
+
+class LineaPedido:
+    __slots__ = ("producto", "cantidad")
+
+    def __init__(self, producto, cantidad=0):
+        self.producto = producto
+        self.cantidad = cantidad
+
+    @property
+    def subtotal_centavos(self):
+        return self.producto.centavos * self.cantidad
+
+
+InstantaneaPedido = namedtuple("InstantaneaPedido", ["lineas", "total_centavos"])
 
 
 class Pedido:
+    # El total se mantiene en centavos enteros y se actualiza al agregar o quitar,
+    # así calcular_total no recorre las líneas en cada escaneo.
     def __init__(self):
-        self.productos = []
-
-    def agregar_producto(self, producto: Producto):
-        self.productos.append(producto)
+        self.lineas = {}
+        self._total_centavos = 0
+        self._instantanea = None
+
+    @property
+    def productos(self):
+        return [linea.producto for linea in self.lineas.values() for _ in range(linea.cantidad)]
+
+    def agregar_producto(self, producto: Producto, cantidad=1):
+        if cantidad <= 0:
+            raise ValueError("La cantidad debe ser positiva.")
+        clave = (producto.nombre, producto.centavos)
+        linea = self.lineas.get(clave)
+        if linea is None:
+            linea = self.lineas[clave] = LineaPedido(producto)
+        linea.cantidad += cantidad
+        self._total_centavos += producto.centavos * cantidad
+        self._instantanea = None
+
+    def quitar_producto(self, producto: Producto, cantidad=1):
+        clave = (producto.nombre, producto.centavos)
+        linea = self.lineas.get(clave)
+        if linea is None or not 0 < cantidad <= linea.cantidad:
+            raise ValueError(f"No hay {cantidad} de {producto.nombre} en el pedido.")
+        linea.cantidad -= cantidad
+        if linea.cantidad == 0:
+            del self.lineas[clave]
+        self._total_centavos -= producto.centavos * cantidad
+        self._instantanea = None
+
+    def vaciar(self):
+        self.lineas.clear()
+        self._total_centavos = 0
+        self._instantanea = None
+
+    @property
+    def total_centavos(self):
+        return self._total_centavos
 
     def calcular_total(self) :
-        return sum(p.precio for p in self.productos)
+        return a_decimal(self._total_centavos)
+
+    def instantanea(self):
+        # Copia inmutable para el ticket; se reutiliza mientras el pedido no cambie
+        if self._instantanea is None:
+            self._instantanea = InstantaneaPedido(
+                tuple((l.producto.nombre, l.producto.centavos, l.cantidad) for l in self.lineas.values()),
+                self._total_centavos,
+            )
+        return self._instantanea
+
+
+# --- Eventos ---
+# Las máquinas, la caja y la cafetería no escriben en consola: emiten eventos a
+# un destino inyectado. Por defecto no se hace nada; EventosLog formatea y escribe
+# en otro hilo, por lotes, fuera del camino del cobro.
+MENSAJES = {
+    "cafe_listo": "☕ Cafetera: Café listo",
+    "tostada_lista": "🍞 Tostadora: Tostada lista",
+    "jugo_preparando": "🧃 Máquina de jugo preparando bebida fría...",
+    "te_listo": "🍵 Té preparado",
+    "cobro": "💰 Total a pagar: ${monto:.2f}",
+    "cobro_lote": "💰 {cobros} cobros, total: ${monto:.2f}",
+    "descuento": "🎉 {regla} aplicado: -${monto:.2f}",
+    "mensaje": "{texto}",
+}
+
+def formatear_evento(tipo, datos):
+    plantilla = MENSAJES.get(tipo)
+    if plantilla is None:
+        return f"{tipo} {datos}"
+    return plantilla.format(**datos)
+
+
+class IEventos(ABC):
+    @abstractmethod
+    def emitir(self, tipo, **datos):
+        pass
+
+    def cerrar(self):
+        pass
+
+
+class EventosNulos(IEventos):
+    def emitir(self, tipo, **datos):
+        pass
+
+
+EVENTOS_NULOS = EventosNulos()
+
+
+class EventosMemoria(IEventos):
+    # Conserva solo los últimos eventos; deque.append es seguro entre hilos
+    def __init__(self, capacidad=10000):
+        self.eventos = deque(maxlen=capacidad)
+
+    def emitir(self, tipo, **datos):
+        self.eventos.append((time.time(), tipo, datos))
+
+    def ultimos(self, cantidad=None):
+        eventos = list(self.eventos)
+        return eventos if cantidad is None else eventos[-cantidad:]
+
+
+class EventosLog(IEventos):
+    # destino: ruta de archivo o un stream abierto (sys.stdout); formato "texto" o "json"
+    def __init__(self, destino=sys.stdout, formato="texto", intervalo=0.05, lote_maximo=1024):
+        self._propio = isinstance(destino, str)
+        self._salida = open(destino, "a", encoding="utf-8") if self._propio else destino
+        self.formato = formato
+        # El registro es de mejor esfuerzo: si la salida falla se pierde el lote, no el hilo
+        self._escritor = EscritorPorLotes(
+            self._persistir, "eventos", intervalo=intervalo, lote_maximo=lote_maximo, reintentar=False
+        )
+
+    @property
+    def descartados(self):
+        return self._escritor.descartados
+
+    @property
+    def ultimo_error(self):
+        return self._escritor.ultimo_error
+
+    def emitir(self, tipo, **datos):
+        self._escritor.agregar((time.time(), tipo, datos))
+
+    def _linea(self, momento, tipo, datos):
+        # Un evento mal armado (p. ej. "cobro" sin monto) no debe tumbar al hilo escritor
+        try:
+            if self.formato == "json":
+                return json.dumps({"ts": momento, "tipo": tipo, **datos}, ensure_ascii=False, default=str)
+            return formatear_evento(tipo, datos)
+        except Exception:
+            return f"{tipo} {datos}"
+
+    def _persistir(self, lote):
+        self._salida.write("".join(self._linea(*evento) + "\n" for evento in lote))
+        self._salida.flush()
+
+    def vaciar(self):
+        # Espera a que todo lo emitido hasta ahora esté escrito
+        self._escritor.esperar(self._escritor.secuencia)
+
+    def cerrar(self):
+        try:
+            self._escritor.cerrar()
+        finally:
+            if self._propio:
+                self._salida.close()
+
+
+class EmiteEventos:
+    def __init__(self, eventos: IEventos = None):
+        self.eventos = eventos or EVENTOS_NULOS
 
 
 class PreparaCafe(ABC):
@@ -35,21 +224,27 @@ class IBebida(ABC):
         pass
 
 
-class Cafetera(PreparaCafe, IBebida):
+class Cafetera(EmiteEventos, PreparaCafe, IBebida):
+    tipo = "cafe"
+
     def preparar_cafe(self):
-        print("☕ Cafetera: Café listo")
+        self.eventos.emitir("cafe_listo")
     def preparar(self):
         self.preparar_cafe()
 
 
-class Tostadora(PreparaTostadas):
+class Tostadora(EmiteEventos, PreparaTostadas):
+    tipo = "tostada"
+
     def preparar_tostada(self):
-        print("🍞 Tostadora: Tostada lista")
+        self.eventos.emitir("tostada_lista")
+
 
+class MaquinaDeJugo(EmiteEventos, IBebida):
+    tipo = "jugo"
 
-class MaquinaDeJugo(IBebida):
     def preparar(self):
-        print("🧃 Máquina de jugo preparando bebida fría...")
+        self.eventos.emitir("jugo_preparando")
 
 
 class MalHerenciaJugo(IBebida):
@@ -57,9 +252,11 @@ class MalHerenciaJugo(IBebida):
         raise TypeError("No se puede heredar de una máquina de bebidas calientes para jugo.")
 
 
-class Te(IBebida):
+class Te(EmiteEventos, IBebida):
+    tipo = "te"
+
     def preparar(self):
-        print("🍵 Té preparado")
+        self.eventos.emitir("te_listo")
 
 
 class ICaja(ABC):
@@ -67,80 +264,635 @@ class ICaja(ABC):
     def cobrar(self, monto):
         pass
 
-class Caja(ICaja):
+    def cobrar_lote(self, montos):
+        for monto in montos:
+            self.cobrar(monto)
+
+class Caja(EmiteEventos, ICaja):
     def cobrar(self, monto):
-        print(f"💰 Total a pagar: ${monto:.2f}")
+        self.eventos.emitir("cobro", monto=monto)
 
 
-class DescuentoFidelidad:
-    def aplicar(self, total, tiene_tarjeta):
-        if tiene_tarjeta:
-            print("🎉 Descuento de fidelidad aplicado (10%)")
-            return total * 0.9
+# --- Libro de ventas ---
+# Registro de solo-agregado compartido por varias cajas. Los cobros se acumulan
+# en memoria y un hilo los persiste por lotes: una sola escritura + fsync (o un
+# commit de SQLite) por lote, como un group commit. Los totales del día se llevan
+# al registrar, así el cierre no vuelve a leer las ventas.
+class LibroVentasError(EscrituraError):
+    pass
+
+
+class LibroVentas(ABC):
+    def __init__(self, intervalo=0.005, lote_maximo=1024, espera_reintento=0.5):
+        self._totales = {}
+        self._escritor = EscritorPorLotes(
+            self._persistir, "libro-ventas", self._abrir(), intervalo, lote_maximo, espera_reintento,
+            tipo_error=LibroVentasError,
+        )
+
+    @abstractmethod
+    def _abrir(self):
+        """Abre el almacén, carga self._totales y devuelve la última secuencia."""
+
+    @abstractmethod
+    def _persistir(self, lote):
+        """Guarda de forma durable una lista de (secuencia, caja, momento, dia, centavos)."""
+
+    @abstractmethod
+    def _cerrar_almacen(self):
+        pass
+
+    def _acumular(self, dia, caja, cobros, centavos):
+        total = self._totales.setdefault((dia, caja), [0, 0])
+        total[0] += cobros
+        total[1] += centavos
+
+    def registrar(self, caja, montos_centavos, momento=None):
+        momento = momento or time.time()
+        dia = time.strftime("%Y-%m-%d", time.localtime(momento))
+        escritor = self._escritor
+        with escritor.condicion:
+            secuencia = escritor.secuencia
+            for centavos in montos_centavos:
+                secuencia = escritor.agregar((secuencia + 1, caja, momento, dia, centavos))
+                self._acumular(dia, caja, 1, centavos)
+            return secuencia
+
+    def esperar_durable(self, secuencia):
+        # Disco lleno, base bloqueada...: lanza LibroVentasError en vez de colgarse
+        self._escritor.esperar(secuencia)
+
+    def totales_del_dia(self, dia=None):
+        dia = dia or time.strftime("%Y-%m-%d")
+        with self._escritor.condicion:
+            return {
+                caja: (cobros, a_decimal(centavos))
+                for (d, caja), (cobros, centavos) in self._totales.items() if d == dia
+            }
+
+    def cerrar(self):
+        try:
+            self._escritor.cerrar()
+        finally:
+            self._cerrar_almacen()
+
+
+class LibroVentasArchivo(LibroVentas):
+    # Una línea JSON por cobro; al abrir se reconstruyen los totales leyendo el archivo
+    def __init__(self, ruta, intervalo=0.005, lote_maximo=1024, espera_reintento=0.5):
+        self.ruta = ruta
+        super().__init__(intervalo, lote_maximo, espera_reintento)
+
+    def _abrir(self):
+        ultima = 0
+        if os.path.exists(self.ruta):
+            with open(self.ruta, "rb+") as archivo:
+                validos = 0
+                for linea in archivo:
+                    # Una línea sin salto final o ilegible es la cola de una caída a mitad de escritura
+                    if not linea.endswith(b"\n"):
+                        break
+                    try:
+                        venta = json.loads(linea)
+                    except ValueError:
+                        break
+                    self._acumular(venta["d"], venta["c"], 1, venta["v"])
+                    ultima = venta["s"]
+                    validos += len(linea)
+                # Se descarta antes de agregar: si no, la primera venta nueva quedaría
+                # pegada a la línea rota y se perdería al volver a abrir
+                if validos < archivo.seek(0, os.SEEK_END):
+                    archivo.truncate(validos)
+                    archivo.flush()
+                    os.fsync(archivo.fileno())
+        self._archivo = open(self.ruta, "ab", buffering=0)
+        return ultima
+
+    def _persistir(self, lote):
+        anexar_sincronizado(self._archivo, "".join(
+            json.dumps({"s": s, "c": c, "m": m, "d": d, "v": v}, ensure_ascii=False) + "\n"
+            for s, c, m, d, v in lote
+        ).encode("utf-8"))
+
+    def _cerrar_almacen(self):
+        self._archivo.close()
+
+
+class LibroVentasSQLite(LibroVentas):
+    # Los totales diarios viven en su propia tabla y se actualizan en la misma
+    # transacción que las ventas del lote
+    def __init__(self, ruta="ventas.db", intervalo=0.005, lote_maximo=1024, espera_reintento=0.5):
+        self.ruta = ruta
+        super().__init__(intervalo, lote_maximo, espera_reintento)
+
+    def _abrir(self):
+        # Solo el hilo escritor usa la conexión después de abrir
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=FULL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS ventas ("
+            "secuencia INTEGER PRIMARY KEY, caja TEXT NOT NULL, momento REAL NOT NULL, "
+            "dia TEXT NOT NULL, centavos INTEGER NOT NULL)"
+        )
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS totales_diarios ("
+            "dia TEXT NOT NULL, caja TEXT NOT NULL, cobros INTEGER NOT NULL, centavos INTEGER NOT NULL, "
+            "PRIMARY KEY (dia, caja))"
+        )
+        self._conexion.commit()
+        for dia, caja, cobros, centavos in self._conexion.execute("SELECT dia, caja, cobros, centavos FROM totales_diarios"):
+            self._acumular(dia, caja, cobros, centavos)
+        return self._conexion.execute("SELECT COALESCE(MAX(secuencia), 0) FROM ventas").fetchone()[0]
+
+    def _persistir(self, lote):
+        agregados = {}
+        for _, caja, _, dia, centavos in lote:
+            total = agregados.setdefault((dia, caja), [0, 0])
+            total[0] += 1
+            total[1] += centavos
+        with self._conexion:
+            self._conexion.executemany("INSERT INTO ventas VALUES (?, ?, ?, ?, ?)", lote)
+            self._conexion.executemany(
+                "INSERT INTO totales_diarios VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(dia, caja) DO UPDATE SET "
+                "cobros = cobros + excluded.cobros, centavos = centavos + excluded.centavos",
+                [(dia, caja, cobros, centavos) for (dia, caja), (cobros, centavos) in agregados.items()],
+            )
+
+    def _cerrar_almacen(self):
+        self._conexion.close()
+
+
+class CajaLibro(Caja):
+    # Caja que deja cada cobro en un LibroVentas; con durable=True no devuelve
+    # hasta que el lote que contiene el cobro quedó guardado
+    def __init__(self, libro: LibroVentas, caja_id="caja-1", durable=True, eventos: IEventos = None):
+        super().__init__(eventos)
+        self.libro = libro
+        self.caja_id = caja_id
+        self.durable = durable
+
+    def cobrar(self, monto):
+        super().cobrar(monto)
+        secuencia = self.libro.registrar(self.caja_id, [a_centavos(monto)])
+        if self.durable:
+            self.libro.esperar_durable(secuencia)
+        return secuencia
+
+    def cobrar_lote(self, montos):
+        centavos = [a_centavos(m) for m in montos]
+        # Un solo evento por lote: uno por cobro inundaría el registro
+        self.eventos.emitir("cobro_lote", cobros=len(centavos), monto=a_decimal(sum(centavos)))
+        secuencia = self.libro.registrar(self.caja_id, centavos)
+        if self.durable:
+            self.libro.esperar_durable(secuencia)
+        return secuencia
+
+
+def porcentaje_de(centavos, porcentaje):
+    return int((Decimal(centavos) * Decimal(str(porcentaje)) / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def a_minutos(hora):
+    horas, minutos = hora.split(":")
+    return int(horas) * 60 + int(minutos)
+
+
+ContextoPrecio = namedtuple("ContextoPrecio", ["momento", "tiene_tarjeta"])
+Cotizacion = namedtuple("Cotizacion", ["subtotal_centavos", "descuentos", "total_centavos"])
+
+
+class EstadoLinea:
+    # Lo que queda por cobrar de una línea mientras se aplican las reglas
+    __slots__ = ("nombre", "unitario", "cantidad", "libres", "restante")
+
+    def __init__(self, nombre, unitario, cantidad):
+        self.nombre = nombre
+        self.unitario = unitario
+        self.cantidad = cantidad
+        self.libres = cantidad
+        self.restante = unitario * cantidad
+
+    def descontar(self, centavos):
+        centavos = min(centavos, self.restante)
+        self.restante -= centavos
+        return centavos
+
+
+# --- Reglas de precio ---
+# Una regla con productos=None aplica a todo el pedido; ventana=("HH:MM", "HH:MM")
+# la limita a una franja horaria (puede cruzar la medianoche).
+class ReglaPrecio(ABC):
+    def __init__(self, nombre, productos=None, ventana=None, prioridad=100):
+        self.nombre = nombre
+        self.productos = frozenset(productos) if productos is not None else None
+        self.ventana = (a_minutos(ventana[0]), a_minutos(ventana[1])) if ventana else None
+        self.prioridad = prioridad
+
+    def activa_en(self, minuto):
+        if self.ventana is None:
+            return True
+        inicio, fin = self.ventana
+        if inicio <= fin:
+            return inicio <= minuto < fin
+        return minuto >= inicio or minuto < fin
+
+    @abstractmethod
+    def aplicar(self, lineas, contexto):
+        """Descuenta sobre las líneas afectadas y devuelve los centavos descontados."""
+
+
+class RebajaProducto(ReglaPrecio):
+    # Porcentaje sobre las unidades que no consumió un combo
+    def __init__(self, nombre, productos, porcentaje, ventana=None, prioridad=100):
+        super().__init__(nombre, productos, ventana, prioridad)
+        self.porcentaje = porcentaje
+
+    def aplicar(self, lineas, contexto):
+        total = 0
+        for linea in lineas:
+            if linea.libres:
+                base = linea.restante * linea.libres // linea.cantidad
+                total += linea.descontar(porcentaje_de(base, self.porcentaje))
         return total
 
 
+class Combo(ReglaPrecio):
+    # Cada juego completo de productos se cobra a precio fijo; sus unidades ya no
+    # reciben rebajas posteriores
+    def __init__(self, nombre, productos, precio, ventana=None, prioridad=50):
+        super().__init__(nombre, productos, ventana, prioridad)
+        self.precio_centavos = a_centavos(precio)
+
+    def aplicar(self, lineas, contexto):
+        por_nombre = {}
+        for linea in lineas:
+            por_nombre.setdefault(linea.nombre, []).append(linea)
+        if len(por_nombre) < len(self.productos):
+            return 0
+        total = 0
+        for componentes in zip(*(por_nombre[p] for p in sorted(self.productos))):
+            juegos = min(l.libres for l in componentes)
+            ahorro = sum(l.unitario for l in componentes) - self.precio_centavos
+            if juegos == 0 or ahorro <= 0:
+                continue
+            pendiente = ahorro * juegos
+            for linea in componentes:
+                linea.libres -= juegos
+                pendiente -= linea.descontar(pendiente)
+            total += ahorro * juegos - pendiente
+        return total
+
+
+class DescuentoFidelidad(ReglaPrecio):
+    def __init__(self, porcentaje=10, prioridad=1000):
+        super().__init__(f"Descuento de fidelidad ({porcentaje}%)", prioridad=prioridad)
+        self.porcentaje = porcentaje
+
+    def aplicar(self, lineas, contexto):
+        if not contexto.tiene_tarjeta:
+            return 0
+        # Por línea, para que reglas posteriores vean lo que queda de cada una
+        return sum(linea.descontar(porcentaje_de(linea.restante, self.porcentaje)) for linea in lineas)
+
+
+# --- Motor de precios ---
+# Las reglas se compilan una vez: el día se corta en tramos donde el conjunto de
+# reglas activas no cambia, y cada tramo indexa sus reglas por producto. Un pedido
+# solo evalúa las reglas de sus productos más las globales, siempre en el orden
+# (prioridad, orden de registro), así el resultado no depende del azar.
+class MotorPrecios:
+    def __init__(self, reglas=()):
+        self.reglas = list(reglas)
+        self._compilar()
+
+    def agregar(self, regla: ReglaPrecio):
+        self.reglas.append(regla)
+        self._compilar()
+
+    def _compilar(self):
+        ordenadas = sorted(enumerate(self.reglas), key=lambda par: (par[1].prioridad, par[0]))
+        self._orden = {id(regla): i for i, (_, regla) in enumerate(ordenadas)}
+        cortes = {0}
+        for regla in self.reglas:
+            if regla.ventana:
+                cortes.update(regla.ventana)
+        self._cortes = sorted(c % 1440 for c in cortes)
+        self._tramos = []
+        for corte in self._cortes:
+            por_producto, globales = {}, []
+            for _, regla in ordenadas:
+                if not regla.activa_en(corte):
+                    continue
+                if regla.productos is None:
+                    globales.append(regla)
+                else:
+                    for producto in regla.productos:
+                        por_producto.setdefault(producto, []).append(regla)
+            self._tramos.append((por_producto, globales))
+
+    def _tramo(self, momento):
+        return bisect_right(self._cortes, momento.hour * 60 + momento.minute) - 1
+
+    def _cotizar(self, tramo, lineas, contexto):
+        por_producto, globales = self._tramos[tramo]
+        candidatas = {}
+        for nombre, _, _ in lineas:
+            for regla in por_producto.get(nombre, ()):
+                candidatas[id(regla)] = regla
+        for regla in globales:
+            candidatas[id(regla)] = regla
+        estado = [EstadoLinea(*linea) for linea in lineas]
+        subtotal = sum(l.restante for l in estado)
+        descuentos = []
+        for regla in sorted(candidatas.values(), key=lambda r: self._orden[id(r)]):
+            afectadas = estado if regla.productos is None else [l for l in estado if l.nombre in regla.productos]
+            centavos = regla.aplicar(afectadas, contexto)
+            if centavos:
+                descuentos.append((regla.nombre, centavos))
+        return Cotizacion(subtotal, tuple(descuentos), sum(l.restante for l in estado))
+
+    def cotizar(self, pedido: Pedido, contexto=None):
+        contexto = contexto or ContextoPrecio(datetime.now(), False)
+        return self._cotizar(self._tramo(contexto.momento), pedido.instantanea().lineas, contexto)
+
+    def cotizar_lote(self, pedidos_y_contextos):
+        # Los pedidos idénticos en el mismo tramo y con el mismo contexto de tarjeta
+        # se cotizan una sola vez
+        resultados, memoria = [], {}
+        for pedido, contexto in pedidos_y_contextos:
+            lineas = pedido.instantanea().lineas
+            clave = (self._tramo(contexto.momento), contexto.tiene_tarjeta, lineas)
+            cotizacion = memoria.get(clave)
+            if cotizacion is None:
+                cotizacion = memoria[clave] = self._cotizar(clave[0], lineas, contexto)
+            resultados.append(cotizacion)
+        return resultados
+
+
+# --- Despacho de pedidos ---
+# Cada máquina tiene su propia cola y un trabajador asyncio; los productos se
+# reparten a la máquina compatible con menos trabajo pendiente.
+class Estacion:
+    def __init__(self, maquina, duracion=0.0, nombre=None):
+        self.maquina = maquina
+        self.duracion = duracion
+        self.nombre = nombre or type(maquina).__name__
+        self.tipo = getattr(maquina, "tipo", None)
+        self.es_bebida = isinstance(maquina, IBebida)
+        self._preparar = maquina.preparar if self.es_bebida else maquina.preparar_tostada
+        self.cola = None
+        self.carga = 0
+        self.preparados = 0
+        self.ocupado = 0.0
+
+    def atiende(self, producto):
+        if producto.tipo is None:
+            return self.es_bebida
+        return producto.tipo == self.tipo
+
+    def costo(self):
+        return (self.carga + 1) * (self.duracion or 1)
+
+    async def trabajar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            producto, listo = await self.cola.get()
+            try:
+                # Si el cliente ya canceló su pedido no se prepara
+                if listo.done():
+                    continue
+                inicio = time.perf_counter()
+                try:
+                    # preparar() es síncrono; se corre fuera del loop para no frenar la caja
+                    await loop.run_in_executor(None, self._preparar)
+                    if self.duracion:
+                        await asyncio.sleep(self.duracion)
+                except asyncio.CancelledError:
+                    # Se cerró el despachador a mitad de la preparación
+                    if not listo.done():
+                        listo.set_exception(RuntimeError(f"{self.nombre}: despachador cerrado durante la preparación"))
+                    raise
+                except Exception as e:
+                    if not listo.done():
+                        listo.set_exception(e)
+                else:
+                    if not listo.done():
+                        listo.set_result(producto)
+                self.ocupado += time.perf_counter() - inicio
+                self.preparados += 1
+            finally:
+                self.carga -= 1
+                self.cola.task_done()
+
+    def abortar_pendientes(self, error):
+        # Falla lo que quedó en la cola sin que nadie lo fuera a preparar
+        while not self.cola.empty():
+            _, listo = self.cola.get_nowait()
+            self.carga -= 1
+            if not listo.done():
+                listo.set_exception(error)
+
+
+class DespachadorPedidos:
+    def __init__(self, estaciones):
+        self.estaciones = [e if isinstance(e, Estacion) else Estacion(e) for e in estaciones]
+        self._trabajadores = []
+        self._inicio = None
+        self._cerrado = False
+
+    async def __aenter__(self):
+        self.iniciar()
+        return self
+
+    async def __aexit__(self, *excepcion):
+        await self.cerrar()
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        for estacion in self.estaciones:
+            estacion.cola = asyncio.Queue()
+            self._trabajadores.append(asyncio.create_task(estacion.trabajar()))
+
+    async def cerrar(self):
+        self._cerrado = True
+        for trabajador in self._trabajadores:
+            trabajador.cancel()
+        await asyncio.gather(*self._trabajadores, return_exceptions=True)
+        self._trabajadores.clear()
+        for estacion in self.estaciones:
+            if estacion.cola is not None:
+                estacion.abortar_pendientes(RuntimeError(f"{estacion.nombre}: despachador cerrado antes de preparar"))
+
+    def _elegir(self, producto):
+        candidatas = [e for e in self.estaciones if e.atiende(producto)]
+        if not candidatas:
+            raise ValueError(f"Ninguna máquina prepara {producto.nombre}.")
+        return min(candidatas, key=Estacion.costo)
+
+    def encolar(self, producto):
+        if self._cerrado:
+            raise RuntimeError("El despachador está cerrado.")
+        listo = asyncio.get_running_loop().create_future()
+        estacion = self._elegir(producto)
+        estacion.carga += 1
+        estacion.cola.put_nowait((producto, listo))
+        return listo
+
+    def encolar_pedido(self, pedido: Pedido):
+        listos = []
+        try:
+            for producto in pedido.productos:
+                listos.append(self.encolar(producto))
+        except Exception:
+            # Si un producto no tiene máquina no se prepara nada del pedido
+            for listo in listos:
+                listo.cancel()
+            raise
+        return listos
+
+    async def preparar_pedido(self, pedido: Pedido):
+        return await asyncio.gather(*self.encolar_pedido(pedido))
+
+    def estadisticas(self):
+        transcurrido = time.perf_counter() - self._inicio if self._inicio else 0.0
+        return [
+            {
+                "estacion": e.nombre,
+                "en_cola": e.cola.qsize() if e.cola else 0,
+                "pendientes": e.carga,
+                "preparados": e.preparados,
+                "por_segundo": e.preparados / transcurrido if transcurrido else 0.0,
+                "utilizacion": e.ocupado / transcurrido if transcurrido else 0.0,
+            }
+            for e in self.estaciones
+        ]
+
+
 class Cafeteria:
     def __init__(
         self,
         maquina_bebida: IBebida,
         caja: ICaja,
-        descuento: DescuentoFidelidad
+        precios: MotorPrecios = None,
+        despachador: DespachadorPedidos = None,
+        eventos: IEventos = None
     ):
+        self.eventos = eventos or EVENTOS_NULOS
         self.maquina_bebida = maquina_bebida
         self.pedido = Pedido()
         self.caja = caja
-        self.descuento = descuento
+        self.precios = precios or MotorPrecios()
+        self.despachador = despachador
 
-    def agregar_producto(self, producto: Producto):
-        self.pedido.agregar_producto(producto)
+    def agregar_producto(self, producto: Producto, cantidad=1):
+        self.pedido.agregar_producto(producto, cantidad)
+
+    def atender_cliente(self, tiene_tarjeta= False, momento=None):
 
-    def atender_cliente(self, tiene_tarjeta= False):
-     
         self.maquina_bebida.preparar()
 
-   
-        total = self.pedido.calcular_total()
 
+        cotizacion = self.precios.cotizar(self.pedido, ContextoPrecio(momento or datetime.now(), tiene_tarjeta))
+
+        for nombre, centavos in cotizacion.descuentos:
+            self.eventos.emitir("descuento", regla=nombre, monto=a_decimal(centavos))
+
+        self.caja.cobrar(a_decimal(cotizacion.total_centavos))
+
+        self.pedido.vaciar()
 
-        total_con_descuento = self.descuento.aplicar(total, tiene_tarjeta)
+    async def atender_cliente_async(self, tiene_tarjeta=False, momento=None):
+        # Los productos van a las colas de las máquinas y se cobra mientras se preparan.
+        # El pedido sale de la caja al empezar: lo que se escanee mientras tanto es del siguiente cliente
+        pedido, self.pedido = self.pedido, Pedido()
+        listos = self.despachador.encolar_pedido(pedido)
+        try:
+            cotizacion = self.precios.cotizar(pedido, ContextoPrecio(momento or datetime.now(), tiene_tarjeta))
 
-        self.caja.cobrar(total_con_descuento)
+            for nombre, centavos in cotizacion.descuentos:
+                self.eventos.emitir("descuento", regla=nombre, monto=a_decimal(centavos))
+
+            await asyncio.get_running_loop().run_in_executor(None, self.caja.cobrar, a_decimal(cotizacion.total_centavos))
+
+            await asyncio.gather(*listos)
+        except BaseException:
+            # Las estaciones saltean lo cancelado; así no se prepara lo que ya no se va a entregar
+            for listo in listos:
+                listo.cancel()
+            raise
+        return cotizacion
 
 
 
 if __name__ == "__main__":
+    eventos = EventosLog(sys.stdout)
+
+    def mostrar(texto):
+        eventos.emitir("mensaje", texto=texto)
    
     cafe = Producto("Café Americano", 35.0)
     te_verde = Producto("Té Verde", 28.0)
 
    
-    maquina_cafe = Cafetera()
-    caja = Caja()
-    descuento = DescuentoFidelidad()
+    maquina_cafe = Cafetera(eventos)
+    caja = Caja(eventos)
+    precios = MotorPrecios([
+        DescuentoFidelidad(),
+        RebajaProducto("Hora feliz de té", ["Té Verde", "Té negro"], 20, ventana=("16:00", "18:00")),
+        Combo("Combo café y té", ["Café Americano", "Té Verde"], 55.0),
+    ])
 
    
-    cafeteria = Cafeteria(maquina_bebida=maquina_cafe, caja=caja, descuento=descuento)
+    cafeteria = Cafeteria(maquina_bebida=maquina_cafe, caja=caja, precios=precios, eventos=eventos)
 
    
     cafeteria.agregar_producto(cafe)
     cafeteria.agregar_producto(te_verde)
 
    
-    print("=== Atención con tarjeta de fidelidad ===")
+    mostrar("=== Atención con tarjeta de fidelidad ===")
     cafeteria.atender_cliente(tiene_tarjeta=True)
 
    
-    print("\n=== Cambio a máquina de jugo ===")
-    maquina_jugo = MaquinaDeJugo()
-    cafeteria2 = Cafeteria(maquina_bebida=maquina_jugo, caja=caja, descuento=descuento)
+    mostrar("\n=== Cambio a máquina de jugo ===")
+    maquina_jugo = MaquinaDeJugo(eventos)
+    cafeteria2 = Cafeteria(maquina_bebida=maquina_jugo, caja=caja, precios=precios, eventos=eventos)
     cafeteria2.agregar_producto(Producto("Jugo de naranja", 40))
     cafeteria2.atender_cliente(tiene_tarjeta=False)
 
-    print("\n=== Cambio a máquina de té ===")
-    maquina_te = Te()
-    cafeteria3 = Cafeteria(maquina_bebida=maquina_te, caja=caja, descuento=descuento)
+    mostrar("\n=== Cambio a máquina de té ===")
+    maquina_te = Te(eventos)
+    cafeteria3 = Cafeteria(maquina_bebida=maquina_te, caja=caja, precios=precios, eventos=eventos)
     cafeteria3.agregar_producto(Producto("Té negro", 25))
     cafeteria3.atender_cliente(tiene_tarjeta=True)
 
-
+    mostrar("\n=== Despacho con varias máquinas ===")
+
+    async def despachar():
+        estaciones = [Estacion(Cafetera(eventos), 0.2, "Cafetera 1"), Estacion(Cafetera(eventos), 0.2, "Cafetera 2"), Estacion(Te(eventos), 0.1), Estacion(Tostadora(eventos), 0.3)]
+        async with DespachadorPedidos(estaciones) as despachador:
+            barra = Cafeteria(maquina_bebida=maquina_cafe, caja=caja, precios=precios, despachador=despachador, eventos=eventos)
+            barra.agregar_producto(Producto("Café Americano", 35.0, "cafe"), 3)
+            barra.agregar_producto(Producto("Té Verde", 28.0, "te"))
+            barra.agregar_producto(Producto("Tostada", 22.0, "tostada"), 2)
+            await barra.atender_cliente_async(tiene_tarjeta=True)
+            for fila in despachador.estadisticas():
+                mostrar(f"{fila['estacion']}: {fila['preparados']} preparados, {fila['en_cola']} en cola, {fila['por_segundo']:.1f}/s")
+
+    asyncio.run(despachar())
+
+    mostrar("\n=== Libro de ventas con varias cajas ===")
+    with tempfile.TemporaryDirectory() as directorio:
+        libro = LibroVentasSQLite(os.path.join(directorio, "ventas.db"))
+        cajas = [CajaLibro(libro, f"caja-{i}", eventos=eventos) for i in range(1, 5)]
+        hilos = [threading.Thread(target=c.cobrar_lote, args=([Decimal("35.00")] * 1000,)) for c in cajas]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        for caja_id, (cobros, total) in sorted(libro.totales_del_dia().items()):
+            mostrar(f"{caja_id}: {cobros} cobros, ${total:.2f}")
+        libro.cerrar()
+
+    eventos.cerrar()
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from Actividad import (
+    Doctor, RepositorioMemoria, RepositorioSQLite, RepositorioMySQL, cargar_configuracion, dividir_en_lotes
+)
+
+ESPECIALIDADES = ["Cardiología", "Pediatría", "Neurología", "Dermatología", "Oncología", "Traumatología"]
+NOMBRES = ["Ana", "Luis", "Marta", "Jorge", "Lucía", "Pedro", "Sofía", "Diego"]
+APELLIDOS = ["García", "López", "Martínez", "Hernández", "Pérez", "Sánchez", "Ramírez", "Torres"]
+
+# ========== BACKENDS ========================
+def crear_backend(nombre, directorio):
+    if nombre == "memoria":
+        return RepositorioMemoria()
+    if nombre == "sqlite":
+        return RepositorioSQLite(os.path.join(directorio, "benchmark.db"))
+    if nombre == "mysql":
+        repositorio = RepositorioMySQL(cargar_configuracion())
+        vaciar_mysql(repositorio)
+        return repositorio
+    raise ValueError(f"Backend desconocido: {nombre}")
+
+def vaciar_mysql(repositorio):
+    # Las cédulas generadas se repiten entre tamaños: cada corrida parte de la tabla vacía
+    repositorio.pool.ejecutar(lambda cursor: cursor.execute("TRUNCATE TABLE doctores"))
+
+def cerrar_backend(nombre, repositorio):
+    if nombre == "mysql":
+        vaciar_mysql(repositorio)
+        repositorio.pool.cerrar()
+    elif hasattr(repositorio, "cerrar"):
+        repositorio.cerrar()
+
+def generar_doctores(cantidad, semilla=42):
+    azar = random.Random(semilla)
+    for i in range(cantidad):
+        nombre = f"{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}"
+        yield Doctor(nombre, azar.choice(ESPECIALIDADES), f"C{i:08d}")
+
+# ========== MEDICIÓN ========================
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, round(p / 100 * (len(ordenadas) - 1)))]
+
+def resumir(nombre, latencias, operaciones, duracion):
+    ordenadas = sorted(latencias)
+    return {
+        "carga": nombre,
+        "operaciones": operaciones,
+        "throughput": operaciones / duracion if duracion else 0.0,
+        "p50_ms": percentil(ordenadas, 50) * 1000,
+        "p99_ms": percentil(ordenadas, 99) * 1000,
+    }
+
+def medir(nombre, llamadas):
+    latencias = []
+    inicio = time.perf_counter()
+    for llamada in llamadas:
+        t0 = time.perf_counter()
+        llamada()
+        latencias.append(time.perf_counter() - t0)
+    duracion = time.perf_counter() - inicio
+    return resumir(nombre, latencias, len(latencias), duracion)
+
+# ========== CARGAS DE TRABAJO ===============
+def carga_inserciones(repositorio, cantidad, tamano_lote):
+    lotes = list(dividir_en_lotes(generar_doctores(cantidad), tamano_lote))
+    latencias = []
+    inicio = time.perf_counter()
+    for lote in lotes:
+        t0 = time.perf_counter()
+        repositorio.agregar_lote(lote, tamano_lote)
+        latencias.append(time.perf_counter() - t0)
+    # Throughput en doctores por segundo; latencias por lote
+    return resumir("inserciones", latencias, cantidad, time.perf_counter() - inicio)
+
+def carga_consultas(repositorio, cantidad, muestras):
+    azar = random.Random(7)
+    cedulas = [f"C{azar.randrange(cantidad * 2):08d}" for _ in range(muestras)]
+    return medir("consultas", (lambda c=c: repositorio.existe_cedula(c) for c in cedulas))
+
+def carga_busquedas(repositorio, muestras, limite=50):
+    azar = random.Random(11)
+    terminos = [azar.choice(NOMBRES + APELLIDOS + ESPECIALIDADES)[:azar.randint(2, 6)] for _ in range(muestras)]
+    return medir("busquedas", (lambda t=t: repositorio.buscar(t, limite) for t in terminos))
+
+def carga_recorrido(repositorio, tamano_pagina=1000):
+    latencias = []
+    filas = 0
+    cursor = None
+    inicio = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        pagina, cursor = repositorio.obtener_pagina(cursor, tamano_pagina)
+        latencias.append(time.perf_counter() - t0)
+        filas += len(pagina)
+        if cursor is None:
+            break
+    # Throughput en filas por segundo; latencias por página
+    return resumir("recorrido", latencias, filas, time.perf_counter() - inicio)
+
+def ejecutar(backend, cantidad, tamano_lote, muestras):
+    with tempfile.TemporaryDirectory() as directorio:
+        repositorio = crear_backend(backend, directorio)
+        try:
+            resultados = [
+                carga_inserciones(repositorio, cantidad, tamano_lote),
+                carga_consultas(repositorio, cantidad, muestras),
+                carga_busquedas(repositorio, max(1, muestras // 10)),
+                carga_recorrido(repositorio),
+            ]
+        finally:
+            cerrar_backend(backend, repositorio)
+    for r in resultados:
+        r["backend"] = backend
+        r["doctores"] = cantidad
+    return resultados
+
+# ========== REPORTE =========================
+def imprimir(resultados):
+    print(f"{'backend':<8} {'doctores':>9} {'carga':<12} {'ops':>9} {'ops/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in resultados:
+        print(
+            f"{r['backend']:<8} {r['doctores']:>9} {r['carga']:<12} {r['operaciones']:>9} "
+            f"{r['throughput']:>12.0f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}"
+        )
+
+def comparar(resultados, ruta_base, tolerancia):
+    with open(ruta_base, "r", encoding="utf-8") as archivo:
+        base = {(r["backend"], r["doctores"], r["carga"]): r for r in json.load(archivo)}
+    regresiones = []
+    for r in resultados:
+        anterior = base.get((r["backend"], r["doctores"], r["carga"]))
+        if anterior and r["throughput"] < anterior["throughput"] * (1 - tolerancia):
+            regresiones.append((r, anterior))
+    for r, anterior in regresiones:
+        print(
+            f"REGRESIÓN {r['backend']}/{r['doctores']}/{r['carga']}: "
+            f"{anterior['throughput']:.0f} -> {r['throughput']:.0f} ops/s"
+        )
+    return not regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de repositorios de doctores")
+    parser.add_argument(
+        "--backends", default="memoria,sqlite",
+        help="memoria, sqlite o mysql (mysql VACÍA la tabla doctores de la base de config.txt; usar una base de pruebas)"
+    )
+    parser.add_argument("--tamanos", default="1000,100000,1000000")
+    parser.add_argument("--lote", type=int, default=1000)
+    parser.add_argument("--muestras", type=int, default=10000)
+    parser.add_argument("--guardar", help="Escribe los resultados en JSON")
+    parser.add_argument("--base", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    resultados = []
+    for backend in args.backends.split(","):
+        for cantidad in (int(t) for t in args.tamanos.split(",")):
+            resultados.extend(ejecutar(backend, cantidad, args.lote, args.muestras))
+    imprimir(resultados)
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+    if args.base and not comparar(resultados, args.base, args.tolerancia):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
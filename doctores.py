@@ -0,0 +1,6 @@
+# Entidad Doctor compartida por Actividad.py (gestión de doctores) y Recetas.py
+class Doctor:
+    def __init__(self, nombre, especialidad, cedula):
+        self.nombre = nombre
+        self.especialidad = especialidad
+        self.cedula = cedula
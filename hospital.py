@@ -1,62 +1,963 @@
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
 import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import datetime
 import pdb
 
-# Clase Paciente
-class Paciente:
-    def __init__(self, nombre, edad, sintomas):
+try:
+    import numpy as np
+except ImportError:  # el puntaje por lotes funciona sin NumPy, solo más lento
+    np = None
+
+from pacientes import Paciente
+from persistencia import EscritorPorLotes, anexar_sincronizado
+
+# Cola de triage: montículo ordenado por gravedad y luego por llegada
+class ColaTriage:
+    RANGOS = {'alta': 0, 'media': 1, 'baja': 2}
+    # Envejecimiento: cada nivel de gravedad "cede" este margen de segundos.
+    # Un paciente 'baja' que ya esperó más de 2 * TOLERANCIA pasa por delante
+    # de un 'alta' que acaba de llegar, así nadie espera indefinidamente.
+    TOLERANCIA = 15 * 60
+
+    def __init__(self, tolerancia=None, reloj=time.monotonic):
+        self.tolerancia = self.TOLERANCIA if tolerancia is None else tolerancia
+        self.reloj = reloj
+        self._monticulo = []
+        self._secuencia = itertools.count()
+        self.profundidad_maxima = 0
+        self.esperas = {gravedad: [0, 0.0, 0.0] for gravedad in self.RANGOS}  # cantidad, total, máximo
+
+    def __len__(self):
+        return len(self._monticulo)
+
+    # Una gravedad definida en reglas externas y desconocida aquí se trata
+    # como la más urgente: ante la duda, se sobre-clasifica.
+    def rango(self, gravedad):
+        return self.RANGOS.get(gravedad, 0)
+
+    # La clave es fija al encolar (llegada + rango * tolerancia), por lo que
+    # el envejecimiento no obliga a reordenar el montículo: O(log n).
+    def encolar(self, paciente, gravedad, llegada=None):
+        paciente.gravedad = gravedad
+        paciente.llegada = self.reloj() if llegada is None else llegada
+        clave = paciente.llegada + self.rango(gravedad) * self.tolerancia
+        heapq.heappush(self._monticulo, (clave, next(self._secuencia), paciente))
+        self.profundidad_maxima = max(self.profundidad_maxima, len(self._monticulo))
+
+    def siguiente(self):
+        if not self._monticulo:
+            return None
+        _, _, paciente = heapq.heappop(self._monticulo)
+        paciente.espera = self.reloj() - paciente.llegada
+        estadistica = self.esperas.setdefault(paciente.gravedad, [0, 0.0, 0.0])
+        estadistica[0] += 1
+        estadistica[1] += paciente.espera
+        estadistica[2] = max(estadistica[2], paciente.espera)
+        return paciente
+
+    # Reconstruye el montículo tras un re-triage masivo: O(n) con heapify
+    def reclasificar(self, gravedades):
+        for (_, _, paciente), gravedad in zip(self._monticulo, gravedades):
+            paciente.gravedad = gravedad
+        self._monticulo = [
+            (paciente.llegada + self.rango(paciente.gravedad) * self.tolerancia, secuencia, paciente)
+            for _, secuencia, paciente in self._monticulo
+        ]
+        heapq.heapify(self._monticulo)
+
+    def pacientes(self):
+        return [paciente for _, _, paciente in self._monticulo]
+
+    def estadisticas(self):
+        return {
+            "profundidad": len(self._monticulo),
+            "profundidad_maxima": self.profundidad_maxima,
+            "esperas": {
+                gravedad: {
+                    "atendidos": cantidad,
+                    "espera_promedio": total / cantidad if cantidad else 0.0,
+                    "espera_maxima": maxima,
+                }
+                for gravedad, (cantidad, total, maxima) in self.esperas.items()
+            },
+        }
+
+# Reglas de gravedad compiladas; se recargan solas si cambia el archivo JSON
+class ReglasGravedad:
+    # Se evalúan en orden; la primera que se cumple gana y si ninguna, 'baja'
+    POR_DEFECTO = [
+        {"gravedad": "alta", "edad_minima": 70, "palabras": ["dolor"]},
+        {"gravedad": "media", "edad_minima": 40, "palabras": []},
+    ]
+
+    def __init__(self, ruta=None, reglas=None, intervalo_revision=1.0):
+        self.ruta = ruta
+        # evaluar() corre por cada llegada: el stat del archivo se hace a lo sumo una vez por intervalo
+        self.intervalo_revision = intervalo_revision
+        self._revisado_en = None
+        self._mtime = None
+        self._mtime_fallido = None
+        self.ultimo_error = None
+        self._compiladas = self._compilar(reglas or self.POR_DEFECTO)
+        self.recargar_si_cambio(forzar=True)
+
+    @staticmethod
+    def _compilar(reglas):
+        compiladas = []
+        for regla in reglas:
+            palabras = [p.lower() for p in regla.get("palabras", [])]
+            # Una sola alternancia precompilada recorre el texto una vez por regla
+            patron = re.compile("|".join(map(re.escape, palabras)), re.IGNORECASE) if palabras else None
+            compiladas.append((regla["gravedad"], regla.get("edad_minima"), patron))
+        return compiladas
+
+    def recargar_si_cambio(self, forzar=False):
+        if self.ruta is None:
+            return False
+        ahora = time.monotonic()
+        if not forzar and self._revisado_en is not None and ahora - self._revisado_en < self.intervalo_revision:
+            return False
+        self._revisado_en = ahora
+        try:
+            mtime = os.stat(self.ruta).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as archivo:
+                compiladas = self._compilar(json.load(archivo))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+            # Archivo a medio guardar o inválido: se siguen usando las reglas anteriores
+            # y se vuelve a intentar en la próxima revisión
+            self.ultimo_error = e
+            if mtime != self._mtime_fallido:
+                self._mtime_fallido = mtime
+                print(f"No se pudieron recargar las reglas de {self.ruta}: {e!r}; se mantienen las anteriores.")
+            return False
+        # Se reemplaza la referencia de una vez: los lectores ven reglas viejas o nuevas, nunca mezcladas
+        self._compiladas = compiladas
+        self._mtime = mtime
+        self.ultimo_error = None
+        return True
+
+    def evaluar(self, edad, sintomas):
+        self.recargar_si_cambio()
+        return self._evaluar_con(self._compiladas, edad, sintomas)
+
+    def evaluar_lote(self, edades, sintomas):
+        self.recargar_si_cambio()
+        compiladas = self._compiladas
+        if np is None:
+            return [self._evaluar_con(compiladas, edad, texto) for edad, texto in zip(edades, sintomas)]
+
+        edades = np.asarray(edades)
+        # Los síntomas se repiten mucho: cada patrón se aplica una vez por texto
+        # distinto y el resultado se expande a todas las filas por indexación.
+        unicos = {}
+        codigos = np.fromiter((unicos.setdefault(texto, len(unicos)) for texto in sintomas), dtype=np.int64)
+        textos = list(unicos)
+
+        # Se aplican de la última a la primera regla para que gane la primera que se cumple
+        resultado = np.full(len(codigos), len(compiladas), dtype=np.int64)
+        for posicion in range(len(compiladas) - 1, -1, -1):
+            _, edad_minima, patron = compiladas[posicion]
+            cumple = np.zeros(len(codigos), dtype=bool)
+            if edad_minima is not None:
+                cumple |= edades >= edad_minima
+            if patron is not None:
+                coincide = np.fromiter((patron.search(texto) is not None for texto in textos), dtype=bool, count=len(textos))
+                cumple |= coincide[codigos]
+            resultado[cumple] = posicion
+        nombres = np.array([gravedad for gravedad, _, _ in compiladas] + ['baja'])
+        return nombres[resultado]
+
+    @staticmethod
+    def _evaluar_con(compiladas, edad, sintomas):
+        for gravedad, edad_minima, patron in compiladas:
+            if (edad_minima is not None and edad >= edad_minima) or (patron is not None and patron.search(sintomas)):
+                return gravedad
+        return 'baja'
+
+# Histograma con cubetas logarítmicas fijas (de 10 µs a ~1000 s)
+class Histograma:
+    LIMITES = [10 ** (e / 10) for e in range(-50, 31)]
+
+    def __init__(self):
+        self.cubetas = [0] * (len(self.LIMITES) + 1)
+        self.cantidad = 0
+        self.total = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def registrar(self, valor):
+        self.cubetas[bisect_left(self.LIMITES, valor)] += 1
+        self.cantidad += 1
+        self.total += valor
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+
+    def percentil(self, p):
+        if not self.cantidad:
+            return 0.0
+        objetivo = p / 100 * self.cantidad
+        acumulado = 0
+        for indice, cantidad in enumerate(self.cubetas):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                # Cota superior de la cubeta, acotada por el máximo observado
+                return min(self.LIMITES[indice], self.maximo) if indice < len(self.LIMITES) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        return {
+            "cantidad": self.cantidad,
+            "promedio": self.total / self.cantidad if self.cantidad else 0.0,
+            "minimo": self.minimo or 0.0,
+            "maximo": self.maximo or 0.0,
+            "p50": self.percentil(50),
+            "p90": self.percentil(90),
+            "p99": self.percentil(99),
+        }
+
+# Instrumentación: tramos con perf_counter, histogramas por fase y log JSON-lines opcional
+class Instrumentacion:
+    def __init__(self, ruta_eventos=None):
+        self.histogramas = {}
+        self._lock = threading.Lock()
+        self._eventos = open(ruta_eventos, "a", encoding="utf-8", buffering=1 << 16) if ruta_eventos else None
+
+    @contextmanager
+    def medir(self, fase, **datos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(fase, time.perf_counter() - inicio, **datos)
+
+    def registrar(self, fase, duracion, **datos):
+        with self._lock:
+            histograma = self.histogramas.get(fase)
+            if histograma is None:
+                histograma = self.histogramas[fase] = Histograma()
+            histograma.registrar(duracion)
+        if self._eventos is not None:
+            self.evento(fase, duracion=duracion, **datos)
+
+    def evento(self, tipo, **datos):
+        if self._eventos is None:
+            return
+        linea = json.dumps({"ts": time.time(), "tipo": tipo, **datos}, ensure_ascii=False)
+        with self._lock:
+            self._eventos.write(linea + "\n")
+
+    def resumen(self):
+        with self._lock:
+            return {fase: h.resumen() for fase, h in self.histogramas.items()}
+
+    def cerrar(self):
+        if self._eventos is not None:
+            with self._lock:
+                self._eventos.close()
+                self._eventos = None
+
+# Registro compacto de un paciente atendido
+class Atencion:
+    __slots__ = ("nombre", "edad", "gravedad", "llegada", "duracion", "espera")
+
+    def __init__(self, nombre, edad, gravedad, llegada, duracion, espera):
         self.nombre = nombre
         self.edad = edad
-        self.sintomas = sintomas
-        self.hora_llegada = None
-        self.duracion = None
+        self.gravedad = gravedad
+        self.llegada = llegada
+        self.duracion = duracion
+        self.espera = espera
+
+    @property
+    def hora_llegada(self):
+        return datetime.fromtimestamp(self.llegada)
+
+# Historial de atendidos: búfer circular en arreglos por columna, con volcado
+# opcional a disco de lo que se descarta y agregados que se mantienen al vuelo.
+class RegistroAtendidos:
+    def __init__(self, capacidad=10000, ruta_desborde=None):
+        self.capacidad = capacidad
+        self._nombres = [None] * capacidad
+        self._edades = array('H', [0]) * capacidad
+        self._gravedades = array('B', [0]) * capacidad
+        self._llegadas = array('d', [0.0]) * capacidad
+        self._duraciones = array('d', [0.0]) * capacidad
+        self._esperas = array('d', [0.0]) * capacidad
+        self._inicio = 0
+        self._cantidad = 0
+        self._codigos = {}
+        self._nombres_gravedad = []
+        self._lock = threading.Lock()
+        self.total = 0
+        self.duraciones = {}
+        self._desborde = open(ruta_desborde, "a", newline="", encoding="utf-8", buffering=1 << 16) if ruta_desborde else None
+        self._escritor = csv.writer(self._desborde) if self._desborde else None
+
+    def __len__(self):
+        return self._cantidad
+
+    def _codigo(self, gravedad):
+        codigo = self._codigos.get(gravedad)
+        if codigo is None:
+            codigo = self._codigos[gravedad] = len(self._nombres_gravedad)
+            self._nombres_gravedad.append(gravedad)
+        return codigo
+
+    def append(self, paciente):
+        gravedad = paciente.gravedad or 'baja'
+        llegada = paciente.hora_llegada.timestamp() if paciente.hora_llegada else time.time()
+        with self._lock:
+            if self._cantidad == self.capacidad:
+                posicion = self._inicio
+                if self._escritor is not None:
+                    self._escritor.writerow(self._fila(posicion))
+                self._inicio = (self._inicio + 1) % self.capacidad
+            else:
+                posicion = (self._inicio + self._cantidad) % self.capacidad
+                self._cantidad += 1
+            self._nombres[posicion] = paciente.nombre
+            self._edades[posicion] = paciente.edad
+            self._gravedades[posicion] = self._codigo(gravedad)
+            self._llegadas[posicion] = llegada
+            self._duraciones[posicion] = paciente.duracion or 0.0
+            self._esperas[posicion] = paciente.espera or 0.0
+            self.total += 1
+            histograma = self.duraciones.get(gravedad)
+            if histograma is None:
+                histograma = self.duraciones[gravedad] = Histograma()
+            histograma.registrar(paciente.duracion or 0.0)
+
+    def _fila(self, posicion):
+        return (
+            self._nombres[posicion], self._edades[posicion],
+            self._nombres_gravedad[self._gravedades[posicion]], self._llegadas[posicion],
+            self._duraciones[posicion], self._esperas[posicion],
+        )
+
+    def __iter__(self):
+        with self._lock:
+            filas = [self._fila((self._inicio + i) % self.capacidad) for i in range(self._cantidad)]
+        return (Atencion(*fila) for fila in filas)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "total": self.total,
+                "retenidos": self._cantidad,
+                "por_gravedad": {gravedad: h.resumen() for gravedad, h in self.duraciones.items()},
+            }
+
+    def cerrar(self):
+        with self._lock:
+            if self._desborde is not None:
+                self._desborde.close()
+                self._desborde = None
+                self._escritor = None
+
+# Diario de eventos de solo-anexado (write-ahead) con commit agrupado:
+# registrar() solo encola en memoria; un hilo escribe y hace fsync por lotes.
+class DiarioEventos:
+    def __init__(self, ruta, intervalo=0.005, lote_maximo=1024, compactar_cada=20000, espera_reintento=0.5):
+        self.ruta = ruta
+        self.ruta_instantanea = ruta + ".snap"
+        # Tope de eventos entre instantáneas: acota lo que hay que reproducir al arrancar
+        self.compactar_cada = compactar_cada
+        self.sin_compactar = 0
+        self._reparar_cola()
+        self._archivo = open(ruta, "ab", buffering=0)
+        self._escritor = EscritorPorLotes(
+            self._persistir, "diario", self._ultima_secuencia(), intervalo, lote_maximo, espera_reintento
+        )
+
+    def _reparar_cola(self):
+        # Cada lote termina en salto de línea: lo que siga al último es una línea
+        # cortada por una caída. Se descarta antes de volver a agregar, o el primer
+        # evento nuevo quedaría pegado a ella y se perdería al reproducir.
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "rb+") as archivo:
+            fin = archivo.seek(0, os.SEEK_END)
+            posicion = fin
+            while posicion > 0:
+                inicio = max(0, posicion - 65536)
+                archivo.seek(inicio)
+                bloque = archivo.read(posicion - inicio)
+                salto = bloque.rfind(b"\n")
+                if salto != -1:
+                    posicion = inicio + salto + 1
+                    break
+                posicion = inicio
+            if posicion < fin:
+                archivo.truncate(posicion)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+
+    def _ultima_secuencia(self):
+        ultima = 0
+        if os.path.exists(self.ruta_instantanea):
+            with open(self.ruta_instantanea, "r", encoding="utf-8") as archivo:
+                ultima = json.load(archivo)["secuencia"]
+        if os.path.exists(self.ruta):
+            # Basta con la cola del archivo: la última línea completa tiene la secuencia mayor
+            with open(self.ruta, "rb") as archivo:
+                archivo.seek(max(0, os.path.getsize(self.ruta) - 65536))
+                for linea in reversed(archivo.read().splitlines()):
+                    try:
+                        return max(ultima, json.loads(linea)["s"])
+                    except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                        continue
+        return ultima
+
+    def _leer_diario(self):
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "r", encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    return  # cola truncada por una caída a mitad de escritura
+
+    def registrar(self, tipo, **datos):
+        with self._escritor.condicion:
+            self.sin_compactar += 1
+            return self._escritor.agregar(
+                json.dumps({"s": self._escritor.secuencia + 1, "t": tipo, **datos}, ensure_ascii=False)
+            )
+
+    def necesita_compactar(self):
+        return self.sin_compactar >= self.compactar_cada
+
+    def esperar_durable(self, secuencia):
+        # Si el disco falla (lleno, sin permisos) lanza EscrituraError en vez de colgarse
+        self._escritor.esperar(secuencia)
+
+    def _persistir(self, lote):
+        # Un solo write + fsync para todo el lote (group commit)
+        anexar_sincronizado(self._archivo, ("\n".join(lote) + "\n").encode("utf-8"))
+
+    def compactar(self, obtener_estado):
+        # Con el diario bloqueado (y ningún lote a medio escribir) se vacía lo
+        # pendiente, se guarda la instantánea de forma atómica y se trunca el
+        # diario: la recuperación solo lee eso.
+        with self._escritor.exclusivo():
+            self._escritor.persistir_pendientes()
+            estado = obtener_estado()
+            temporal = self.ruta_instantanea + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump({"secuencia": self._escritor.secuencia, "estado": estado}, archivo, ensure_ascii=False)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, self.ruta_instantanea)
+            self._archivo.truncate(0)
+            self._archivo.seek(0)
+            self.sin_compactar = 0
+
+    def cargar(self):
+        estado, desde = None, 0
+        if os.path.exists(self.ruta_instantanea):
+            with open(self.ruta_instantanea, "r", encoding="utf-8") as archivo:
+                instantanea = json.load(archivo)
+            estado, desde = instantanea["estado"], instantanea["secuencia"]
+        return estado, [e for e in self._leer_diario() if e["s"] > desde]
+
+    def cerrar(self):
+        try:
+            self._escritor.cerrar()
+        finally:
+            self._archivo.close()
 
 # Clase ServicioUrgencias
 class ServicioUrgencias:
-    def __init__(self):
-        self.pacientes_atendidos = []
+    def __init__(self, depurar=False, instrumentacion=None, reglas=None, historial=10000, ruta_desborde=None,
+                 diario=None):
+        self.pacientes_atendidos = RegistroAtendidos(historial, ruta_desborde)
+        self.cola = ColaTriage()
+        self.depurar = depurar
+        self.instrumentacion = instrumentacion or Instrumentacion()
+        self.reglas = reglas or ReglasGravedad()
+        self.diario = diario
+        self._ultimo_id = 0
+        self._en_tratamiento = {}
+        # Protege cola + _en_tratamiento + sus eventos del diario. Orden fijo:
+        # primero este cerrojo y después el del diario (compactar también lo sigue).
+        self._lock = threading.RLock()
 
-    def atender(self, paciente):
+    def encolar(self, paciente):
         paciente.hora_llegada = datetime.now()
-        print(f"Atendiendo a {paciente.nombre}, gravedad: {self.evaluar_gravedad(paciente)}")
+        with self.instrumentacion.medir("evaluacion", paciente=paciente.nombre):
+            gravedad = self.evaluar_gravedad(paciente)
+        with self._lock:
+            # El id se asigna junto con su evento: dos llegadas simultáneas nunca comparten id
+            if paciente.id is None:
+                self._ultimo_id += 1
+                paciente.id = self._ultimo_id
+            self.cola.encolar(paciente, gravedad)
+            if self.diario is not None:
+                self.diario.registrar(
+                    "llegada", id=paciente.id, nombre=paciente.nombre, edad=paciente.edad,
+                    sintomas=paciente.sintomas, gravedad=gravedad, hora=paciente.hora_llegada.timestamp()
+                )
+        self.instrumentacion.evento("llegada", paciente=paciente.nombre, gravedad=gravedad)
+        print(f"Llega {paciente.nombre}, gravedad: {gravedad} (en espera: {len(self.cola)})")
 
-        # Punto de depuración
-        pdb.set_trace()
+    def siguiente(self):
+        with self._lock:
+            paciente = self.cola.siguiente()
+            # Sale de la cola y entra en tratamiento de forma atómica: una
+            # compactación nunca lo ve fuera de ambos
+            if paciente is not None and self.diario is not None:
+                self._en_tratamiento[paciente.id] = paciente
+        if paciente is not None:
+            self.instrumentacion.registrar("espera", paciente.espera, paciente=paciente.nombre, gravedad=paciente.gravedad)
+        return paciente
 
-        inicio = time.time()
-        self.tratar(paciente)
-        fin = time.time()
+    def atender_siguiente(self):
+        paciente = self.siguiente()
+        if paciente is not None:
+            self.atender(paciente)
+        return paciente
 
-        paciente.duracion = fin - inicio
+    def atender(self, paciente):
+        if paciente.hora_llegada is None:
+            paciente.hora_llegada = datetime.now()
+        if paciente.gravedad is None:
+            with self.instrumentacion.medir("evaluacion", paciente=paciente.nombre):
+                paciente.gravedad = self.evaluar_gravedad(paciente)
+        print(f"Atendiendo a {paciente.nombre}, gravedad: {paciente.gravedad}")
+
+        # Punto de depuración, solo si se pidió explícitamente
+        if self.depurar:
+            pdb.set_trace()
+
+        self.tratar_instrumentado(paciente)
         self.pacientes_atendidos.append(paciente)
 
+    def tratar_instrumentado(self, paciente):
+        if self.diario is not None:
+            with self._lock:
+                self._en_tratamiento[paciente.id] = paciente
+                self.diario.registrar("inicio", id=paciente.id, espera=paciente.espera)
+        inicio = time.perf_counter()
+        self.tratar(paciente)
+        paciente.duracion = time.perf_counter() - inicio
+        self.instrumentacion.registrar("tratamiento", paciente.duracion, paciente=paciente.nombre, gravedad=paciente.gravedad)
+        if self.diario is not None:
+            with self._lock:
+                self.diario.registrar("fin", id=paciente.id, duracion=paciente.duracion)
+                self._en_tratamiento.pop(paciente.id, None)
+            if self.diario.necesita_compactar():
+                try:
+                    self.compactar_diario()
+                except OSError as e:
+                    # Nada se pierde: lo pendiente sigue en cola y se compacta en el próximo paciente
+                    print(f"No se pudo compactar el diario: {e}")
+
+    # --- Persistencia: instantánea + diario ---
+    def estado(self):
+        with self._lock:
+            pendientes = list(self._en_tratamiento.values()) + self.cola.pacientes()
+        return {
+            "siguiente_id": self._ultimo_id + 1,
+            "pendientes": [
+                {
+                    "id": p.id, "nombre": p.nombre, "edad": p.edad, "sintomas": p.sintomas,
+                    "gravedad": p.gravedad, "hora": p.hora_llegada.timestamp(),
+                }
+                for p in pendientes
+            ],
+        }
+
+    def compactar_diario(self):
+        with self._lock:
+            self.diario.compactar(self.estado)
+
+    def restaurar(self):
+        # Reconstruye la sala de espera: instantánea + eventos posteriores.
+        # Quien estaba en tratamiento al caer el proceso vuelve a la cola.
+        estado, eventos = self.diario.cargar()
+        pendientes = {}
+        siguiente_id = 1
+        if estado:
+            siguiente_id = estado["siguiente_id"]
+            for datos in estado["pendientes"]:
+                pendientes[datos["id"]] = datos
+        for evento in eventos:
+            tipo = evento["t"]
+            if tipo == "llegada":
+                pendientes.setdefault(evento["id"], evento)
+                siguiente_id = max(siguiente_id, evento["id"] + 1)
+            elif tipo == "triage":
+                for id_paciente, gravedad in evento["gravedades"].items():
+                    if int(id_paciente) in pendientes:
+                        pendientes[int(id_paciente)]["gravedad"] = gravedad
+            elif tipo == "inicio":
+                if evento["id"] in pendientes:
+                    pendientes[evento["id"]]["espera"] = evento.get("espera")
+            elif tipo == "fin":
+                datos = pendientes.pop(evento["id"], None)
+                if datos is not None:
+                    paciente = self._paciente_desde(datos)
+                    paciente.espera = datos.get("espera")
+                    paciente.duracion = evento["duracion"]
+                    self.pacientes_atendidos.append(paciente)
+
+        ahora_reloj, ahora = self.cola.reloj(), time.time()
+        for datos in sorted(pendientes.values(), key=lambda d: d["hora"]):
+            paciente = self._paciente_desde(datos)
+            # La llegada se traslada al reloj monótono actual para conservar la antigüedad
+            self.cola.encolar(paciente, datos["gravedad"], llegada=ahora_reloj - (ahora - datos["hora"]))
+        self._ultimo_id = siguiente_id - 1
+        return len(pendientes)
+
+    @staticmethod
+    def _paciente_desde(datos):
+        paciente = Paciente(datos["nombre"], datos["edad"], datos["sintomas"])
+        paciente.id = datos["id"]
+        paciente.gravedad = datos["gravedad"]
+        paciente.hora_llegada = datetime.fromtimestamp(datos["hora"])
+        return paciente
+
     def evaluar_gravedad(self, paciente):
-        if paciente.edad >= 70 or 'dolor' in paciente.sintomas.lower():
-            return 'alta'
-        elif paciente.edad >= 40:
-            return 'media'
-        else:
-            return 'baja'
+        return self.reglas.evaluar(paciente.edad, paciente.sintomas)
+
+    def evaluar_gravedad_lote(self, pacientes):
+        return self.reglas.evaluar_lote([p.edad for p in pacientes], [p.sintomas for p in pacientes])
+
+    # Re-triage de toda la sala de espera con las reglas vigentes
+    def reevaluar_cola(self):
+        # Con el cerrojo tomado la cola no cambia entre leerla y reclasificarla
+        with self._lock:
+            with self.instrumentacion.medir("reevaluacion", pacientes=len(self.cola)):
+                pacientes = self.cola.pacientes()
+                gravedades = self.evaluar_gravedad_lote(pacientes)
+                self.cola.reclasificar(gravedades)
+            if self.diario is not None:
+                self.diario.registrar("triage", gravedades={str(p.id): str(g) for p, g in zip(pacientes, gravedades)})
 
     def tratar(self, paciente):
         print(f"Tratando a {paciente.nombre}... (simulación)")
         time.sleep(2)
 
+# Motor de atención con N estaciones que toman pacientes de la cola compartida
+class MotorUrgencias:
+    def __init__(self, servicio, estaciones=3):
+        self.servicio = servicio
+        self.estaciones = estaciones
+        self._condicion = threading.Condition()
+        self._cerrado = False
+        self._hilos = []
+        self.inicio = None
+        self.fin = None
+        self.ocupacion = [0.0] * estaciones
+        self.atendidos_por_estacion = [0] * estaciones
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+        for estacion in range(self.estaciones):
+            hilo = threading.Thread(target=self._trabajar, args=(estacion,), name=f"estacion-{estacion}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def ingresar(self, paciente):
+        with self._condicion:
+            self.servicio.encolar(paciente)
+            self._condicion.notify()
+
+    def finalizar(self):
+        # Las estaciones terminan de vaciar la cola antes de detenerse
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        for hilo in self._hilos:
+            hilo.join()
+        self._hilos = []
+
+    def _tomar(self):
+        with self._condicion:
+            while not len(self.servicio.cola) and not self._cerrado:
+                self._condicion.wait()
+            return self.servicio.siguiente()
+
+    def _trabajar(self, estacion):
+        while True:
+            paciente = self._tomar()
+            if paciente is None:
+                return
+            self.servicio.tratar_instrumentado(paciente)
+            fin = time.perf_counter()
+            with self._condicion:
+                self.ocupacion[estacion] += paciente.duracion
+                self.atendidos_por_estacion[estacion] += 1
+                self.servicio.pacientes_atendidos.append(paciente)
+                self.fin = fin
+
+    def reporte(self):
+        makespan = (self.fin - self.inicio) if self.fin is not None else 0.0
+        return {
+            "estaciones": self.estaciones,
+            "makespan": makespan,
+            "atendidos": sum(self.atendidos_por_estacion),
+            "throughput": sum(self.atendidos_por_estacion) / makespan if makespan else 0.0,
+            "por_estacion": [
+                {
+                    "estacion": estacion,
+                    "atendidos": self.atendidos_por_estacion[estacion],
+                    "utilizacion": self.ocupacion[estacion] / makespan if makespan else 0.0,
+                }
+                for estacion in range(self.estaciones)
+            ],
+        }
+
+# Simulación de eventos discretos en tiempo virtual (unidad: minutos)
+SINTOMAS_SIMULADOS = ["dolor de pecho", "fiebre y tos", "dolor de cabeza", "mareo", "fractura", "corte leve", "náuseas"]
+
+def llegadas_poisson(tasa):
+    # tasa: pacientes por minuto
+    def intervalos(azar):
+        while True:
+            yield azar.expovariate(tasa)
+    return intervalos
+
+def llegadas_rafagas(tasa_calma, tasa_rafaga, duracion_calma, duracion_rafaga):
+    # Proceso de Poisson modulado por dos estados (calma / ráfaga)
+    def intervalos(azar):
+        en_rafaga = False
+        restante = azar.expovariate(1 / duracion_calma)
+        acumulado = 0.0
+        while True:
+            intervalo = azar.expovariate(tasa_rafaga if en_rafaga else tasa_calma)
+            if intervalo <= restante:
+                restante -= intervalo
+                yield acumulado + intervalo
+                acumulado = 0.0
+            else:
+                # Cambia de estado antes de la llegada; por la falta de memoria
+                # de la exponencial basta con volver a sortear con la nueva tasa
+                acumulado += restante
+                en_rafaga = not en_rafaga
+                restante = azar.expovariate(1 / (duracion_rafaga if en_rafaga else duracion_calma))
+    return intervalos
+
+def tratamiento_exponencial(medias):
+    # medias: minutos de tratamiento por gravedad
+    return lambda azar, gravedad: azar.expovariate(1 / medias[gravedad])
+
+def tratamiento_lognormal(medias, sigma=0.5):
+    mus = {gravedad: math.log(media) - sigma ** 2 / 2 for gravedad, media in medias.items()}
+    return lambda azar, gravedad: azar.lognormvariate(mus[gravedad], sigma)
+
+def tratamiento_fijo(medias):
+    return lambda azar, gravedad: medias[gravedad]
+
+class SimuladorUrgencias:
+    MEDIAS_TRATAMIENTO = {'alta': 30.0, 'media': 15.0, 'baja': 8.0}
+    ESTACIONES = 3
+
+    def __init__(self, estaciones=None, llegadas=None, tratamiento=None, semilla=None, servicio=None):
+        self.estaciones = estaciones or self.ESTACIONES
+        self.llegadas = llegadas or llegadas_poisson(0.12)
+        self.tratamiento = tratamiento or tratamiento_exponencial(self.MEDIAS_TRATAMIENTO)
+        self.azar = random.Random(semilla)
+        self.servicio = servicio or ServicioUrgencias()
+        self.reloj = 0.0
+
+    def _pacientes(self, cantidad):
+        azar = self.azar
+        for i in range(cantidad):
+            yield Paciente(f"P{i}", azar.randint(0, 95), azar.choice(SINTOMAS_SIMULADOS))
+
+    def ejecutar(self, cantidad):
+        evaluar = self.servicio.evaluar_gravedad
+        cola = ColaTriage(tolerancia=ColaTriage.TOLERANCIA / 60, reloj=lambda: self.reloj)
+        esperas = {gravedad: [] for gravedad in ColaTriage.RANGOS}
+        ocupacion = [0.0] * self.estaciones
+        libres = list(range(self.estaciones))
+        fines = []  # montículo de (minuto de fin, estación)
+
+        intervalos = self.llegadas(self.azar)
+        pacientes = self._pacientes(cantidad)
+        proxima_llegada = next(intervalos)
+        ultima_llegada = 0.0
+        pendientes = cantidad
+        self.reloj = 0.0
+
+        while pendientes or fines:
+            if fines and (not pendientes or fines[0][0] <= proxima_llegada):
+                self.reloj, estacion = heapq.heappop(fines)
+                libres.append(estacion)
+            else:
+                self.reloj = ultima_llegada = proxima_llegada
+                paciente = next(pacientes)
+                cola.encolar(paciente, evaluar(paciente))
+                pendientes -= 1
+                if pendientes:
+                    proxima_llegada = self.reloj + next(intervalos)
+            while libres and len(cola):
+                paciente = cola.siguiente()
+                esperas.setdefault(paciente.gravedad, []).append(paciente.espera)
+                duracion = self.tratamiento(self.azar, paciente.gravedad)
+                estacion = libres.pop()
+                ocupacion[estacion] += duracion
+                heapq.heappush(fines, (self.reloj + duracion, estacion))
+
+        return self._reporte(cantidad, esperas, ocupacion, cola, ultima_llegada)
+
+    def _reporte(self, cantidad, esperas, ocupacion, cola, ultima_llegada):
+        makespan = self.reloj
+        por_gravedad = {}
+        for gravedad, valores in esperas.items():
+            valores.sort()
+            n = len(valores)
+            percentil = lambda p: valores[min(n - 1, int(p / 100 * n))] if n else 0.0
+            por_gravedad[gravedad] = {
+                "pacientes": n,
+                "espera_promedio": sum(valores) / n if n else 0.0,
+                "p50": percentil(50),
+                "p90": percentil(90),
+                "p99": percentil(99),
+                "maxima": valores[-1] if n else 0.0,
+            }
+        return {
+            "pacientes": cantidad,
+            "estaciones": self.estaciones,
+            "makespan": makespan,
+            "utilizacion": sum(ocupacion) / (makespan * self.estaciones) if makespan else 0.0,
+            # Estaciones ocupadas en promedio si nadie esperara (tasa de llegada x tratamiento medio)
+            "carga_ofrecida": sum(ocupacion) / ultima_llegada if ultima_llegada else 0.0,
+            "profundidad_maxima": cola.profundidad_maxima,
+            "por_gravedad": por_gravedad,
+        }
+
+def simular(args):
+    if args.llegadas == "rafagas":
+        llegadas = llegadas_rafagas(args.tasa, args.tasa * 4, 120.0, 20.0)
+    else:
+        llegadas = llegadas_poisson(args.tasa)
+    medias = {g: m * args.factor_tratamiento for g, m in SimuladorUrgencias.MEDIAS_TRATAMIENTO.items()}
+    tratamiento = {
+        "exponencial": tratamiento_exponencial,
+        "lognormal": tratamiento_lognormal,
+        "fijo": tratamiento_fijo,
+    }[args.tratamiento](medias)
+    # --estaciones 0 significa "atención secuencial" en tiempo real; aquí se usa la dotación por defecto
+    simulador = SimuladorUrgencias(args.estaciones if args.estaciones > 0 else None, llegadas, tratamiento, args.semilla)
+
+    inicio = time.perf_counter()
+    reporte = simulador.ejecutar(args.simular)
+    real = time.perf_counter() - inicio
+
+    print(f"--- Simulación: {reporte['pacientes']} pacientes, {reporte['estaciones']} estaciones ---")
+    print(f"Tiempo simulado: {reporte['makespan'] / 60:.1f} h | Tiempo real: {real:.2f}s")
+    print(f"Utilización: {reporte['utilizacion']:.0%} | Máx. en espera: {reporte['profundidad_maxima']}")
+    if reporte["carga_ofrecida"] >= reporte["estaciones"]:
+        print(
+            f"Aviso: la carga ofrecida ({reporte['carga_ofrecida']:.2f} estaciones) no es menor que las "
+            f"{reporte['estaciones']} estaciones; la cola crece sin límite y las esperas dependen de N. "
+            f"Aumente --estaciones o reduzca --tasa / --factor-tratamiento."
+        )
+    for gravedad, r in reporte["por_gravedad"].items():
+        print(
+            f"{gravedad:<6} n={r['pacientes']:<8} espera (min) prom: {r['espera_promedio']:.1f} | "
+            f"p50: {r['p50']:.1f} | p90: {r['p90']:.1f} | p99: {r['p99']:.1f} | máx: {r['maxima']:.1f}"
+        )
+
 # Función principal
 def main():
-    urgencias = ServicioUrgencias()
+    parser = argparse.ArgumentParser(description="Servicio de urgencias")
+    parser.add_argument("--estaciones", type=int, default=0,
+                        help="Atiende en paralelo con N estaciones (0 = atención secuencial; "
+                             f"en --simular, {SimuladorUrgencias.ESTACIONES})")
+    parser.add_argument("--depurar", action="store_true",
+                        help="Detiene la atención de cada paciente en pdb")
+    parser.add_argument("--eventos", help="Archivo JSON-lines donde registrar los eventos")
+    parser.add_argument("--reglas", help="Archivo JSON con las reglas de gravedad (se recarga al cambiar)")
+    parser.add_argument("--historial", type=int, default=10000, help="Pacientes atendidos que se conservan en memoria")
+    parser.add_argument("--desborde", help="Archivo CSV donde volcar los atendidos que salen del historial")
+    parser.add_argument("--diario", help="Diario de eventos; al arrancar se restaura la sala de espera desde él")
+    parser.add_argument("--simular", type=int, metavar="N",
+                        help="Simula N pacientes en tiempo virtual en lugar de atender en tiempo real")
+    parser.add_argument("--llegadas", choices=["poisson", "rafagas"], default="poisson")
+    parser.add_argument("--tasa", type=float, default=0.12, help="Llegadas por minuto (simulación)")
+    parser.add_argument("--tratamiento", choices=["exponencial", "lognormal", "fijo"], default="exponencial")
+    parser.add_argument("--factor-tratamiento", type=float, default=1.0,
+                        help="Multiplica los tiempos medios de tratamiento (simulación)")
+    parser.add_argument("--semilla", type=int)
+    args = parser.parse_args()
+
+    if args.simular:
+        simular(args)
+        return
+
+    instrumentacion = Instrumentacion(args.eventos)
+    urgencias = ServicioUrgencias(depurar=args.depurar, instrumentacion=instrumentacion,
+                                  reglas=ReglasGravedad(args.reglas),
+                                  historial=args.historial, ruta_desborde=args.desborde,
+                                  diario=DiarioEventos(args.diario) if args.diario else None)
+    if urgencias.diario is not None:
+        inicio = time.perf_counter()
+        restaurados = urgencias.restaurar()
+        print(f"Restaurados {restaurados} pacientes en espera en {(time.perf_counter() - inicio) * 1000:.1f} ms")
 
     paciente1 = Paciente("Ana", 68, "dolor de pecho")
     paciente2 = Paciente("Luis", 25, "fiebre y tos")
     paciente3 = Paciente("Marta", 73, "dolor de cabeza")
 
-    urgencias.atender(paciente1)
-    urgencias.atender(paciente2)
-    urgencias.atender(paciente3)
+    if args.estaciones > 0:
+        motor = MotorUrgencias(urgencias, args.estaciones)
+        for paciente in (paciente1, paciente2, paciente3):
+            motor.ingresar(paciente)
+        motor.iniciar()
+        motor.finalizar()
+        reporte = motor.reporte()
+    else:
+        urgencias.encolar(paciente1)
+        urgencias.encolar(paciente2)
+        urgencias.encolar(paciente3)
+
+        while urgencias.atender_siguiente() is not None:
+            pass
+        reporte = None
 
     print("\n--- Pacientes Atendidos ---")
     for p in urgencias.pacientes_atendidos:
         print(f"{p.nombre} | Edad: {p.edad} | Llegó: {p.hora_llegada.strftime('%H:%M:%S')} | Duración: {p.duracion:.2f}s")
 
+    if reporte:
+        print(f"\n--- Estaciones ({reporte['estaciones']}) ---")
+        print(f"Makespan: {reporte['makespan']:.2f}s | Throughput: {reporte['throughput']:.2f} pacientes/s")
+        for e in reporte["por_estacion"]:
+            print(f"Estación {e['estacion']} | Atendidos: {e['atendidos']} | Utilización: {e['utilizacion']:.0%}")
+
+    print("\n--- Duración por gravedad ---")
+    for gravedad, r in urgencias.pacientes_atendidos.estadisticas()["por_gravedad"].items():
+        print(f"{gravedad:<6} n={r['cantidad']} | promedio: {r['promedio']:.2f}s | p90: {r['p90']:.2f}s")
+
+    print("\n--- Tiempos por fase ---")
+    for fase, r in instrumentacion.resumen().items():
+        print(f"{fase:<12} n={r['cantidad']} | p50: {r['p50'] * 1000:.3f} ms | p99: {r['p99'] * 1000:.3f} ms | máx: {r['maximo'] * 1000:.3f} ms")
+    instrumentacion.cerrar()
+    urgencias.pacientes_atendidos.cerrar()
+    if urgencias.diario is not None:
+        urgencias.compactar_diario()
+        urgencias.diario.cerrar()
+
 if __name__ == "__main__":
     main()
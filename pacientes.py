@@ -0,0 +1,12 @@
+# Entidad Paciente compartida por hospital.py y Recetas.py
+class Paciente:
+    def __init__(self, nombre, edad, sintomas):
+        self.nombre = nombre
+        self.edad = edad
+        self.sintomas = sintomas
+        self.hora_llegada = None
+        self.duracion = None
+        self.gravedad = None
+        self.llegada = None
+        self.espera = None
+        self.id = None
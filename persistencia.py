@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class EscrituraError(RuntimeError):
+    pass
+
+
+def permisos_para(ruta):
+    # mkstemp crea el temporal con 0600; el destino debe quedar como cualquier
+    # archivo nuevo (según la umask) o conservar los permisos del que reemplaza
+    try:
+        return os.stat(ruta).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def anexar_sincronizado(archivo, datos):
+    # archivo abierto con open(ruta, "ab", buffering=0). Si falla la escritura o
+    # el fsync se recorta lo que haya quedado a medias: el reintento reescribe
+    # el lote completo y no quedan líneas cortadas ni duplicadas.
+    inicio = os.fstat(archivo.fileno()).st_size
+    try:
+        vista = memoryview(datos)
+        while vista:
+            vista = vista[archivo.write(vista):]
+        os.fsync(archivo.fileno())
+    except Exception:
+        try:
+            archivo.truncate(inicio)
+        except OSError:
+            pass
+        raise
+
+
+# Commit agrupado: agregar() solo encola en memoria y un hilo persiste lo
+# acumulado con una sola llamada a persistir(lote). Cada elemento recibe una
+# secuencia; esperar(secuencia) vuelve cuando ese elemento quedó guardado.
+#
+# Si persistir falla, con reintentar=True el lote vuelve al frente de la cola
+# y se reintenta cada espera_reintento segundos, y quienes esperan reciben
+# tipo_error en vez de colgarse; con reintentar=False el lote se descarta
+# (registros de mejor esfuerzo) y se cuenta en descartados.
+class EscritorPorLotes:
+    def __init__(self, persistir, nombre, secuencia=0, intervalo=0.005, lote_maximo=1024,
+                 espera_reintento=0.5, reintentar=True, tipo_error=EscrituraError):
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.lote_maximo = lote_maximo
+        self.espera_reintento = espera_reintento
+        self.reintentar = reintentar
+        self.tipo_error = tipo_error
+        self._persistir = persistir
+        self.condicion = threading.Condition()
+        # Lo tiene quien esté escribiendo en el almacén: el hilo durante un lote,
+        # o exclusivo() para operaciones como compactar
+        self._escritura = threading.Lock()
+        self.pendientes = []
+        self.secuencia = secuencia
+        self.durable = secuencia
+        self.error = None
+        self.ultimo_error = None
+        self.descartados = 0
+        self.cerrado = False
+        self._hilo = threading.Thread(target=self._escribir, name=nombre, daemon=True)
+        self._hilo.start()
+
+    def agregar(self, elemento):
+        # Si el elemento lleva su secuencia (self.secuencia + 1), armarlo con self.condicion tomada
+        with self.condicion:
+            self.secuencia += 1
+            self.pendientes.append(elemento)
+            if len(self.pendientes) >= self.lote_maximo:
+                self.condicion.notify_all()
+            return self.secuencia
+
+    def esperar(self, secuencia):
+        with self.condicion:
+            self.condicion.notify_all()
+            while self.durable < secuencia:
+                if self.error is not None:
+                    raise self.tipo_error(
+                        f"{self.nombre}: {secuencia} quedó registrado pero no guardado: {self.error!r}"
+                    ) from self.error
+                if self.cerrado and not self._hilo.is_alive():
+                    return
+                self.condicion.wait()
+
+    @contextmanager
+    def exclusivo(self):
+        # Ningún lote queda a medio escribir mientras dure el bloque
+        with self._escritura, self.condicion:
+            yield
+
+    def persistir_pendientes(self):
+        # Guarda ya lo que esté en cola; llamar dentro de exclusivo()
+        if self.pendientes:
+            self._persistir(self.pendientes)
+            self.pendientes = []
+        self.error = None
+        self.durable = self.secuencia
+        self.condicion.notify_all()
+
+    def _escribir(self):
+        while True:
+            with self.condicion:
+                if not self.pendientes and not self.cerrado:
+                    self.condicion.wait(self.intervalo)
+            with self._escritura:
+                with self.condicion:
+                    lote, self.pendientes = self.pendientes, []
+                    hasta = self.secuencia
+                    cerrado = self.cerrado
+                error = None
+                if lote:
+                    try:
+                        self._persistir(lote)
+                    except Exception as e:
+                        error = e
+                with self.condicion:
+                    if error is None:
+                        self.error = None
+                        self.durable = max(self.durable, hasta)
+                    elif self.reintentar:
+                        self.pendientes[:0] = lote
+                        self.error = self.ultimo_error = error
+                    else:
+                        self.descartados += len(lote)
+                        self.ultimo_error = error
+                        self.durable = max(self.durable, hasta)
+                    self.condicion.notify_all()
+            if error is not None and self.reintentar:
+                if cerrado:
+                    return
+                self._esperar_reintento()
+            elif cerrado and not lote:
+                return
+
+    def _esperar_reintento(self):
+        limite = time.monotonic() + self.espera_reintento
+        with self.condicion:
+            while not self.cerrado:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return
+                self.condicion.wait(restante)
+
+    def cerrar(self):
+        with self.condicion:
+            self.cerrado = True
+            self.condicion.notify_all()
+        self._hilo.join()
+        if self.pendientes:
+            raise self.tipo_error(
+                f"{self.nombre}: {len(self.pendientes)} sin guardar al cerrar: {self.ultimo_error!r}"
+            ) from self.ultimo_error